@@ -0,0 +1,66 @@
+"""
+Chess Claim Tool: analysis benchmark
+
+Measures the time of the first (full) analysis of a round with a growing number
+of worker processes. Run from the root of the repository:
+
+    $ python -m benchmarks.analysis --boards 500 --plies 160
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import os
+from time import perf_counter
+
+from benchmarks.generator import make_tournament
+from src.models.analysis import make_analysis
+from src.models.claims import Claims
+from src.models.reader import PgnIndex
+
+
+def bench_workers(raw_games: list, workers: int) -> float:
+    analysis = make_analysis(Claims(), workers)
+    try:
+        analysis.start()
+        start = perf_counter()
+        analysis.analyse(raw_games, False)
+        return perf_counter() - start
+    finally:
+        analysis.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, default=200)
+    parser.add_argument("--plies", type=int, default=160)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    pgn = make_tournament(args.boards, args.plies).encode("utf-8")
+    raw_games = [("tournament.pgn", raw_game) for raw_game in PgnIndex().update(pgn)]
+
+    serial = None
+    workers = 1
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    while workers <= args.max_workers:
+        seconds = bench_workers(raw_games, workers)
+        serial = serial or seconds
+        print(f"{workers:>8} {seconds:>10.3f} {serial / seconds:>8.2f}")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Chess Claim Tool: benchmarks generator
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import random
+
+from chess import Board, PAWN
+from chess.pgn import Game
+
+
+def make_game(rnd: random.Random, board_number: int, plies: int, shuffle: bool, clocks: bool = False) -> Game:
+    """ Returns: A random game. A shuffling game starts repeating moves after its first third,
+    which makes it produce repetition claims.
+    Args:
+        rnd: The random generator.
+        board_number: The number of the board the game is played on.
+        plies: The maximum number of moves (half-moves) of the game.
+        shuffle: If True, the game is repetition heavy.
+        clocks: If True, every move has a [%clk] comment, like the moves of a broadcast.
+    """
+    board = Board()
+    game = Game()
+    game.headers["Event"] = "Synthetic Open"
+    game.headers["Round"] = "1"
+    game.headers["White"] = f"White Player {board_number}"
+    game.headers["Black"] = f"Black Player {board_number}"
+    game.headers["Board"] = str(board_number)
+    game.headers["Result"] = "*"
+
+    node = game
+    remaining = [5400, 5400]
+    for ply in range(plies):
+        legal_moves = list(board.legal_moves)
+        if not legal_moves:
+            break
+
+        move = None
+        if shuffle and ply > plies // 3 and len(board.move_stack) >= 4:
+            move = board.move_stack[-4]
+            if move not in legal_moves:
+                move = None
+        if move is None:
+            quiet_moves = [move for move in legal_moves
+                           if not board.is_capture(move) and board.piece_type_at(move.from_square) != PAWN]
+            move = rnd.choice(quiet_moves if quiet_moves and rnd.random() < 0.7 else legal_moves)
+
+        node = node.add_variation(move)
+        board.push(move)
+        if clocks:
+            remaining[ply % 2] -= rnd.randint(5, 120)
+            node.set_clock(remaining[ply % 2])
+    return game
+
+
+def is_shuffling(board_number: int, repetitions: float) -> bool:
+    """ Returns: True if the game of the board is repetition heavy, e.g. every other board for 0.5. """
+    return int(board_number * repetitions) != int((board_number - 1) * repetitions)
+
+
+def make_tournament(boards: int, plies: int = 120, seed: int = 0, clocks: bool = False,
+                    repetitions: float = 0.5) -> str:
+    """ Returns: The pgn of a tournament round, some of its games being repetition heavy.
+    Args:
+        boards: The number of games of the round.
+        plies: The maximum number of moves (half-moves) of every game.
+        seed: The seed of the random generator, the same seed makes the same pgn.
+        clocks: If True, every move has a [%clk] comment.
+        repetitions: The share of the games that are repetition heavy, spread evenly over the boards.
+    """
+    rnd = random.Random(seed)
+    games = [str(make_game(rnd, board_number, plies, is_shuffling(board_number, repetitions), clocks))
+             for board_number in range(1, boards + 1)]
+    return "\n\n".join(games) + "\n"
@@ -0,0 +1,81 @@
+"""
+Chess Claim Tool: move formatting benchmark
+
+Measures the per-ply cost of Claims.check_game over a generated round, when the SAN of
+every move is made eagerly (before every push, as check_game did before) and when it
+is made lazily (only for the plies that produce a claim, as check_game does now).
+Run from the root of the repository:
+
+    $ python -m benchmarks.move_formatting --boards 100
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+from io import StringIO
+from time import perf_counter
+from typing import List
+
+from chess import Board, Move
+
+from benchmarks.generator import make_tournament
+from src.models.claims import Claims, GameCursor, GameKey
+from src.models.mainline import MainlineGame, read_mainline
+from src.models.reader import PgnIndex
+
+
+class EagerClaims(Claims):
+    """ The Claims as they were before the change: the SAN of every move is made before its push. """
+
+    def check_move(self, cursor: GameCursor, move: Move, board_number: str, players: str, game_key: GameKey) -> bool:
+        self.printable_move = self.get_printable_move(cursor.ply + 1, cursor.board.san(move))
+        return super().check_move(cursor, move, board_number, players, game_key)
+
+    def get_last_move(self, board: Board, move_counter: int) -> str:
+        return self.printable_move
+
+
+def check_games(claims: Claims, games: List[MainlineGame]) -> list:
+    entries = []
+    for game in games:
+        entries.extend(claims.check_game(game))
+    return entries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, default=100)
+    parser.add_argument("--plies", type=int, default=160)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pgn = make_tournament(args.boards, args.plies).encode("utf-8")
+    games = [read_mainline(StringIO(raw_game.decode("utf-8"))) for raw_game in PgnIndex().update(pgn)]
+    plies = sum(len(game.mainline_moves()) for game in games)
+
+    print(f"{'san':>8} {'us/ply':>8} {'claims':>7}")
+    for name, claims_type in (("eager", EagerClaims), ("lazy", Claims)):
+        # Every repeat checks the games from their first move, with a new Claims.
+        seconds = float("inf")
+        for _ in range(args.repeat):
+            claims = claims_type()
+            start = perf_counter()
+            entries = check_games(claims, games)
+            seconds = min(seconds, perf_counter() - start)
+        print(f"{name:>8} {seconds / plies * 1e6:>8.2f} {len(entries):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Chess Claim Tool: repetition benchmark
+
+Compares the repetition detection of the GameCursor (a position count table keyed by
+Zobrist hash) with python-chess' Board.is_repetition on a corpus of synthetic games.
+The detections must be the same on every ply. Run from the root of the repository:
+
+    $ python -m benchmarks.repetition --boards 100 --plies 300
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import sys
+from io import StringIO
+from time import perf_counter
+from typing import List, Tuple
+
+from chess import Board, Move
+from chess.pgn import read_game
+
+from benchmarks.generator import make_tournament
+from src.models.claims import GameCursor
+
+
+def python_chess_detections(board: Board, moves: List[Move]) -> List[Tuple[bool, bool]]:
+    detections = []
+    for move in moves:
+        board.push(move)
+        detections.append((board.is_repetition(count=3), board.is_fivefold_repetition()))
+    return detections
+
+
+def cursor_detections(board: Board, moves: List[Move]) -> List[Tuple[bool, bool]]:
+    cursor = GameCursor(board)
+    detections = []
+    for move in moves:
+        repetitions = cursor.push(move)
+        detections.append((repetitions >= 3, repetitions >= 5))
+    return detections
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, default=100)
+    parser.add_argument("--plies", type=int, default=300)
+    args = parser.parse_args()
+
+    pgn = StringIO(make_tournament(args.boards, args.plies))
+    games = []
+    while game := read_game(pgn):
+        games.append((game, list(game.mainline_moves())))
+    plies = sum(len(moves) for _, moves in games)
+
+    results = {}
+    print(f"{'detector':>14} {'us/ply':>8}")
+    for name, detector in (("python-chess", python_chess_detections), ("zobrist", cursor_detections)):
+        start = perf_counter()
+        results[name] = [detector(game.board(), moves) for game, moves in games]
+        print(f"{name:>14} {(perf_counter() - start) / plies * 1e6:>8.2f}")
+
+    if results["python-chess"] != results["zobrist"]:
+        print("The detections differ from python-chess")
+        sys.exit(1)
+    print(f"Same detections on {plies} plies")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Chess Claim Tool: startup benchmark
+
+Measures the cold start of the GUI in fresh interpreters: the time until the
+interpreter runs the first line, until the application modules are imported and
+until the main window is first painted. Every run is a new process, so the
+numbers include the imports that a warm interpreter would have cached.
+Run from the root of the repository:
+
+    $ python -m benchmarks.startup --runs 10
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+from time import time
+
+MILESTONES = ["interpreter", "imports", "first_paint"]
+
+
+def probe() -> None:
+    """ Starts the GUI, prints the wall clock time of every milestone as JSON and exits. """
+    milestones = {"interpreter": time()}
+
+    import main
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    milestones["imports"] = time()
+
+    class PaintFilter(QObject):
+        def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+            if event.type() == QEvent.Paint and "first_paint" not in milestones:
+                milestones["first_paint"] = time()
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    app = main.create_app()
+    paint_filter = PaintFilter()
+    app.view.installEventFilter(paint_filter)
+    app.exec_()
+
+    print(json.dumps(milestones))
+
+
+def run_once() -> dict:
+    """ Returns: The time in seconds from the start of a new process to every milestone. """
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and "DISPLAY" not in env and "WAYLAND_DISPLAY" not in env:
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    start = time()
+    output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--probe"], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    milestones = json.loads(output.strip().splitlines()[-1])
+    return {name: milestones[name] - start for name in MILESTONES}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        return probe()
+
+    results = [run_once() for _ in range(args.runs)]
+    print(f"{'milestone':>12} {'median ms':>10} {'min ms':>8}")
+    for name in MILESTONES:
+        times = [result[name] * 1000 for result in results]
+        print(f"{name:>12} {median(times):>10.1f} {min(times):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
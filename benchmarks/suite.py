@@ -0,0 +1,257 @@
+"""
+Chess Claim Tool: benchmark suite
+
+Runs every stage of the pipeline on synthetic tournaments of growing size and
+reports the throughput (games/s, plies/s) and the peak memory of every stage:
+    - check_game: Claims.check_game on games that are already parsed.
+    - scan: A single pass of Scan, the first (full) pass over a pgn file.
+    - rescan: A single pass of Scan over the same pgn file, when nothing changed.
+    - rehash: A single pass of Scan over the same pgn file, rewritten with the same games.
+    - view: ChessClaimView.add_items_to_table, with the claims of the round (needs PyQt).
+The results can be saved as a baseline, and later runs are compared with it.
+Run from the root of the repository:
+
+    $ python -m benchmarks.suite --boards 50 500 2000 --save-baseline
+    $ python -m benchmarks.suite --boards 50 500 2000
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from io import StringIO
+from time import perf_counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.generator import make_tournament
+from src.models.claims import Claims
+from src.models.mainline import read_mainline
+from src.models.reader import PgnIndex
+from src.models.workers import Scan
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# The application and the view of the view stage, see get_view.
+view_app = None
+
+
+class Tournament(NamedTuple):
+    """ A synthetic round, written to a pgn file.
+    Attributes:
+        boards: The number of games.
+        plies: The number of moves (half-moves) of all the games.
+        path: The pgn file.
+        raw_games: The raw bytes of every game.
+    """
+    boards: int
+    plies: int
+    path: str
+    raw_games: List[bytes]
+
+
+class Stage(NamedTuple):
+    """ A stage of the pipeline. The setup is not measured, the run is.
+    Attributes:
+        setup: Returns the state of the run, from the tournament.
+        run: Runs the stage once, on the state.
+    """
+    setup: Callable[[Tournament], Any]
+    run: Callable[[Any], None]
+
+
+def make_round(directory: str, boards: int, plies: int, clocks: bool, repetitions: float) -> Tournament:
+    pgn = make_tournament(boards, plies, seed=boards, clocks=clocks, repetitions=repetitions).encode("utf-8")
+    path = os.path.join(directory, f"round{boards}.pgn")
+    with open(path, "wb") as file:
+        file.write(pgn)
+
+    raw_games = PgnIndex().update(pgn)
+    total_plies = sum(len(read_mainline(StringIO(raw_game.decode("utf-8"))).mainline_moves())
+                      for raw_game in raw_games)
+    return Tournament(boards, total_plies, path, raw_games)
+
+
+def setup_check_game(tournament: Tournament):
+    return Claims(), [read_mainline(StringIO(raw_game.decode("utf-8"))) for raw_game in tournament.raw_games]
+
+
+def run_check_game(state) -> None:
+    claims, games = state
+    for game in games:
+        claims.check_game(game)
+
+
+def setup_scan(tournament: Tournament) -> Scan:
+    return Scan(Claims(), [tournament.path], None, lambda: False, None)
+
+
+def setup_rescan(tournament: Tournament) -> Scan:
+    scan = setup_scan(tournament)
+    scan.run()
+    return scan
+
+
+def setup_rehash(tournament: Tournament) -> Scan:
+    scan = setup_rescan(tournament)
+    stat = os.stat(tournament.path)
+    os.utime(tournament.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    return scan
+
+
+def get_view():
+    """ Returns: The application and the view, created once: every view starts the thread of
+    its NotificationDispatcher, which runs until the process exits.
+    """
+    global view_app
+    if view_app is None:
+        from PyQt5.QtWidgets import QApplication
+        from src.views.main_view import ChessClaimView
+
+        class NullController:
+            """ The view only needs the callbacks of the controller to exist. """
+            def __getattr__(self, name: str):
+                return lambda *args: None
+
+        app = QApplication.instance() or QApplication(sys.argv[:1])
+        view = ChessClaimView(NullController())
+        view.set_gui()
+        view_app = app, view
+    return view_app
+
+
+def setup_view(tournament: Tournament):
+    app, view = get_view()
+
+    entries = []
+    scan = setup_scan(tournament)
+    scan.on_entries = lambda batch, times: entries.extend(batch)
+    scan.run()
+    return app, view, entries
+
+
+def run_view(state) -> None:
+    app, view, entries = state
+    view.clear_table()
+    view.add_items_to_table(entries)
+    app.processEvents()
+
+
+STAGES: Dict[str, Stage] = {
+    "check_game": Stage(setup_check_game, run_check_game),
+    "scan": Stage(setup_scan, Scan.run),
+    "rescan": Stage(setup_rescan, Scan.run),
+    "rehash": Stage(setup_rehash, Scan.run),
+    "view": Stage(setup_view, run_view),
+}
+
+
+def measure(stage: Stage, tournament: Tournament, repeat: int) -> Dict[str, float]:
+    """ Returns: The throughput of the stage (the best of the repeats) and its peak memory.
+    The memory is measured in a separate run, since tracing the allocations slows the run down.
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        state = stage.setup(tournament)
+        start = perf_counter()
+        stage.run(state)
+        seconds = min(seconds, perf_counter() - start)
+
+    state = stage.setup(tournament)
+    tracemalloc.start()
+    try:
+        stage.run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"games_per_second": tournament.boards / seconds, "plies_per_second": tournament.plies / seconds,
+            "peak_mib": peak / 2 ** 20}
+
+
+def has_qt() -> bool:
+    try:
+        import PyQt5.QtWidgets  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def compare(result: Dict[str, float], baseline: Optional[Dict[str, float]], tolerance: float) -> Tuple[str, bool]:
+    """ Returns: The change of the throughput against the baseline, and whether it is a regression. """
+    if not baseline:
+        return "", False
+    ratio = result["plies_per_second"] / baseline["plies_per_second"]
+    return f"{ratio - 1:+.0%}", ratio < 1 - tolerance
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--plies", type=int, default=160)
+    parser.add_argument("--clocks", action="store_true", help="Add a [%%clk] comment to every move.")
+    parser.add_argument("--repetitions", type=float, default=0.5, help="The share of repetition heavy games.")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="The file of the saved baselines.")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baselines.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="The slowdown against the baseline that is reported as a regression.")
+    args = parser.parse_args()
+
+    if "view" in args.stages and not has_qt():
+        args.stages.remove("view")
+    if "view" in args.stages and sys.platform.startswith("linux") and "DISPLAY" not in os.environ:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baselines = json.load(file)
+
+    # The results of different pgn shapes are not comparable, so the shape is part of the key.
+    shape = f"plies={args.plies},clocks={args.clocks},repetitions={args.repetitions}"
+    results = baselines if args.save_baseline else {}
+    regressions = []
+
+    print(f"{'stage':>10} {'boards':>6} {'games/s':>10} {'plies/s':>12} {'peak MiB':>9} {'vs base':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for boards in args.boards:
+            tournament = make_round(directory, boards, args.plies, args.clocks, args.repetitions)
+            for name in args.stages:
+                key = f"{name}:{boards}:{shape}"
+                result = measure(STAGES[name], tournament, args.repeat)
+                change, regressed = compare(result, baselines.get(key), args.tolerance)
+                if regressed:
+                    regressions.append(key)
+                results[key] = result
+                print(f"{name:>10} {boards:>6} {result['games_per_second']:>10.0f} "
+                      f"{result['plies_per_second']:>12.0f} {result['peak_mib']:>9.1f} {change:>8}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=4, sort_keys=True)
+        print(f"Saved the baselines to {args.baseline}")
+    elif regressions:
+        print(f"Regressions (slower than the baseline by more than {args.tolerance:.0%}): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
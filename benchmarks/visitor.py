@@ -0,0 +1,73 @@
+"""
+Chess Claim Tool: visitor benchmark
+
+Measures the time to read and check for claims a round:
+    - read_game: read_game (which builds the GameNode tree of every game), then Claims.check_game.
+    - mainline: read_mainline (which builds no tree and drops the comments), then Claims.check_game.
+The broadcasts have a [%clk] comment on every move, use --clocks for them.
+Run from the root of the repository:
+
+    $ python -m benchmarks.visitor --boards 200 --clocks
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+from io import StringIO
+from time import perf_counter
+from typing import List
+
+from chess.pgn import read_game
+
+from benchmarks.generator import make_tournament
+from src.models.claims import Claims
+from src.models.mainline import read_mainline
+from src.models.reader import PgnIndex
+
+
+def read_with_game(texts: List[str]) -> int:
+    claims = Claims()
+    return sum(len(claims.check_game(read_game(StringIO(text)))) for text in texts)
+
+
+def read_with_visitor(texts: List[str]) -> int:
+    claims = Claims()
+    return sum(len(claims.check_game(read_mainline(StringIO(text)))) for text in texts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, default=200)
+    parser.add_argument("--plies", type=int, default=160)
+    parser.add_argument("--clocks", action="store_true", help="Add a [%%clk] comment to every move.")
+    args = parser.parse_args()
+
+    pgn = make_tournament(args.boards, args.plies, clocks=args.clocks).encode("utf-8")
+    texts = [raw_game.decode("utf-8") for raw_game in PgnIndex().update(pgn)]
+
+    plies = sum(len(read_mainline(StringIO(text)).mainline_moves()) for text in texts)
+
+    baseline = None
+    print(f"{'reader':>10} {'us/ply':>8} {'speedup':>8} {'claims':>7}")
+    for name, read in (("read_game", read_with_game), ("mainline", read_with_visitor)):
+        start = perf_counter()
+        claims = read(texts)
+        seconds = perf_counter() - start
+        baseline = baseline or seconds
+        print(f"{name:>10} {seconds / plies * 1e6:>8.2f} {baseline / seconds:>8.2f} {claims:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+from multiprocessing import freeze_support
 from sys import exit
 from src.controllers import ChessClaimController
 from PyQt5.QtWidgets import QApplication
@@ -23,7 +24,9 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 from src.helpers import resource_path
 
-if __name__ == '__main__':
+
+def create_app() -> ChessClaimController:
+    """ Creates the application and shows the main window. """
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
 
     app = ChessClaimController()
@@ -35,4 +38,9 @@ if __name__ == '__main__':
     app.setStyleSheet(css)
 
     app.do_start()
-    exit(app.exec_())
+    return app
+
+
+if __name__ == '__main__':
+    freeze_support()
+    exit(create_app().exec_())
@@ -17,21 +17,37 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+from __future__ import annotations
+
 import json
 import os.path
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait
 from threading import Event, Thread, Lock
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
 
-from PyQt5.QtCore import QThreadPool
+from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5.QtWidgets import QApplication
 from src.helpers import get_appdata_path, Status
-from src.models.claims import Claims
-from src.models.workers import CheckDownload, DownloadGames, MakePgn, Scan, Stop
-from src.views.dialog_view import AddSourceDialog
-from src.views.dialog_view import SourceHBox
 from src.views.main_view import ChessClaimView, sources_warning
 
+# The models (python-chess) and the Source Dialog are imported when they are first used,
+# so they do not delay the first paint of the main window.
+if TYPE_CHECKING:
+    from src.models.claims import Claims
+    from src.models.latency import PassTimes
+    from src.views.dialog_view import SourceHBox
+
+
+class WorkerSignals(QObject):
+    """ The Qt adapter of the workers. The callbacks of a worker are the emits of these
+    signals, so the connected slots run in the GUI thread. """
+    status_signal = pyqtSignal(Status)
+    traffic_signal = pyqtSignal(int, int)
+    add_entries_signal = pyqtSignal(list, object)
+    enable_signal = pyqtSignal()
+    disable_signal = pyqtSignal()
+
 
 class ChessClaimController(QApplication):
     """ The Controller of the whole application.
@@ -39,22 +55,38 @@ class ChessClaimController(QApplication):
     Attributes:
         model: Object of the Claims Class.
         view: The main views(GUI) of the application.
+        download_signals: The signals of the download worker.
+        scan_signals: The signals of the scan worker.
+        stop_signals: The signals of the stop worker.
+        metrics_server: The server of the metrics of the workers, while the Metrics Endpoint is checked.
     """
-    __slots__ = ['view', 'model', 'sources_dialog', 'make_pgn_worker', 'stop_worker', 'download_worker', 'scan_worker',
-                 'stop_event']
+    __slots__ = ['view', 'model', 'sources_dialog', 'stop_worker', 'download_worker', 'scan_worker', 'stop_event',
+                 'download_signals', 'scan_signals', 'stop_signals', 'metrics_server']
 
     def __init__(self) -> None:
         super().__init__(sys.argv)
         self.view = ChessClaimView(self)
-        self.model = Claims()
+        self.model: Optional[Claims] = None
         self.sources_dialog = None
 
-        self.make_pgn_worker = None
         self.download_worker = None
         self.scan_worker = None
         self.stop_worker = None
 
         self.stop_event = Event()
+        self.metrics_server = None
+
+        self.download_signals = WorkerSignals()
+        self.download_signals.status_signal.connect(self.update_download_status)
+        self.download_signals.traffic_signal.connect(self.update_download_traffic)
+
+        self.scan_signals = WorkerSignals()
+        self.scan_signals.add_entries_signal.connect(self.update_claims_table)
+        self.scan_signals.status_signal.connect(self.update_bar_scan_status)
+
+        self.stop_signals = WorkerSignals()
+        self.stop_signals.enable_signal.connect(self.on_stop_enable_status)
+        self.stop_signals.disable_signal.connect(self.on_stop_disable_status)
 
     def do_start(self) -> None:
         """ Perform startup operations and shows the dialog.
@@ -93,40 +125,41 @@ class ChessClaimController(QApplication):
 
         """ If the scan thread is alive it means the scan button is already
         clicked before. So if the user click it again nothing should happen."""
-        if self.scan_worker and self.scan_worker.isRunning():
+        if self.scan_worker and self.scan_worker.is_alive():
             return
 
         self.view.clear_table()
         self.view.change_scan_button_text(Status.ACTIVE)
 
+        downloads_mutex = Lock()
         download_list = self.sources_dialog.get_download_list()
         if download_list:
-            self.start_download_worker(download_list)
+            self.start_download_worker(download_list, downloads_mutex)
 
-        games_pgn_mutex = Lock()
-        self.start_make_png_worker(games_pgn_mutex)
-        self.start_scan_worker(games_pgn_mutex)
+        self.start_scan_worker(downloads_mutex)
 
     def on_stop_button_clicked(self) -> None:
         """ Creates a thread in order to stop all the other running Threads(
-        downloadWorker, makePgnWorker,scanWorker)
+        downloadWorker, scanWorker)
 
         trigger: User clicks the "Stop" Button on the Main Window.
         """
-        if not self.scan_worker or not self.scan_worker.isRunning():
+        if not self.scan_worker or not self.scan_worker.is_alive():
             return
 
-        self.stop_worker = Stop(self.stop_event, self.make_pgn_worker, self.scan_worker, self.download_worker)
+        from src.models.workers import Stop
 
-        self.stop_worker.enable_signal.connect(self.on_stop_enable_status)
-        self.stop_worker.disable_signal.connect(self.on_stop_disable_status)
+        self.stop_worker = Stop(self.stop_event, self.scan_worker, self.download_worker,
+                                on_disable=self.stop_signals.disable_signal.emit,
+                                on_enable=self.stop_signals.enable_signal.emit)
         self.stop_worker.start()
-        self.stop_worker.wait()
+        self.stop_worker.join()
 
         """ Clear all the variables storing information from the model
         in order to be ready for the new scan. """
         self.model.empty_dont_check()
         self.model.empty_entries()
+        self.model.empty_cursors()
 
         # Reset stop event
         self.stop_event.clear()
@@ -137,11 +170,48 @@ class ChessClaimController(QApplication):
         """
         self.view.load_about_dialog()
 
+    def on_latency_clicked(self) -> None:
+        """ Calls the views in order to display the Claim Latency Dialog.
+        trigger: User clicked the Claim Latency section in the menu.
+        """
+        self.view.load_latency_dialog()
+
+    def on_profile_toggled(self, checked: bool) -> None:
+        """ Starts profiling the cycles of the workers, or saves their profile in the application data.
+        trigger: User checked or unchecked the Profile Scan option in the menu.
+        """
+        from src.models.profiler import PROFILER
+
+        if checked:
+            PROFILER.start()
+        else:
+            self.view.show_profiles(PROFILER.stop(os.path.join(get_appdata_path(), "profiles")))
+
+    def on_metrics_toggled(self, checked: bool) -> None:
+        """ Starts or stops serving the metrics of the workers on localhost.
+        trigger: User checked or unchecked the Metrics Endpoint option in the menu.
+        """
+        from src.models.metrics import MetricsServer
+
+        if not checked:
+            if self.metrics_server:
+                self.metrics_server.stop()
+                self.metrics_server = None
+            return
+
+        try:
+            self.metrics_server = MetricsServer()
+        except OSError:
+            self.view.metrics_warning(MetricsServer.DEFAULT_PORT)
+            self.view.metrics_option.setChecked(False)
+            return
+        self.metrics_server.start()
+
     def on_stop_disable_status(self) -> None:
         """ Disables the "Scan" & "Stop" Buttons and the statusBar.
         Also changes the status of the scanButton.
 
-        trigger: By the disableSignal(pyqtSignal)
+        trigger: By the disable_signal of the stop worker
         """
         self.view.change_scan_button_text(Status.WAIT)
         self.view.disable_buttons()
@@ -152,7 +222,7 @@ class ChessClaimController(QApplication):
         Also changes the status of the scanButton, download and scan info at the
         statusBar.
 
-        trigger: By the enableSignal(pyqtSignal)
+        trigger: By the enable_signal of the stop worker
         """
         self.view.change_scan_button_text(Status.STOP)
         self.update_download_status(Status.STOP)
@@ -168,48 +238,66 @@ class ChessClaimController(QApplication):
         else:
             self.view.set_sources_status(Status.ERROR)
 
-    def update_claims_table(self, entry: list) -> None:
-        self.view.add_item_to_table(entry)
+    def update_claims_table(self, entries: list, times: PassTimes) -> None:
+        self.view.add_items_to_table(entries, times)
 
     def update_download_status(self, status: Status) -> None:
         self.view.set_download_status(status)
 
+    def update_download_traffic(self, received: int, saved: int) -> None:
+        self.view.set_download_traffic(received, saved)
+
     def update_bar_scan_status(self, status: Status) -> None:
         self.view.set_scan_status(status)
 
-    def start_download_worker(self, downloads: Dict[str, str]) -> None:
+    def start_download_worker(self, downloads: Dict[str, str], lock: Lock) -> None:
         if not downloads:
             return
 
-        self.download_worker = DownloadGames(downloads, self.stop_event)
-        self.download_worker.status_signal.connect(self.update_download_status)
+        from src.models.workers import DownloadGames
+
+        self.download_worker = DownloadGames(downloads, self.stop_event, lock,
+                                             on_status=self.download_signals.status_signal.emit,
+                                             on_traffic=self.download_signals.traffic_signal.emit)
         self.download_worker.start()
 
-    def start_make_png_worker(self, lock: Lock) -> None:
+    def start_scan_worker(self, lock: Lock) -> None:
+        from src.models.cache import AnalysisCache
+        from src.models.claims import Claims
+        from src.models.workers import Scan
+
+        if not self.model:
+            self.model = Claims(AnalysisCache(os.path.join(get_appdata_path(), AnalysisCache.FILENAME)))
         filepaths = self.sources_dialog.get_filepath_list()
-        self.make_pgn_worker = MakePgn(filepaths, self.stop_event, lock)
-        self.make_pgn_worker.start()
 
-    def start_scan_worker(self, lock: Lock) -> None:
-        app_path = get_appdata_path()
-        filename = os.path.join(app_path, "games.pgn")
+        workers = self.view.get_analysis_workers()
 
-        self.scan_worker = Scan(self.model, filename, lock, self.view.live_pgn_option, self.stop_event)
-        self.scan_worker.add_entry_signal.connect(self.update_claims_table)
-        self.scan_worker.status_signal.connect(self.update_bar_scan_status)
+        self.scan_worker = Scan(self.model, filepaths, lock, self.view.live_pgn_option.isChecked, self.stop_event,
+                                workers, on_entries=self.scan_signals.add_entries_signal.emit,
+                                on_status=self.scan_signals.status_signal.emit)
         self.scan_worker.start()
 
 
 class SourceDialogController:
-    """ Handles user interaction with the GUI of the dialog. """
+    """ Handles user interaction with the GUI of the dialog.
+
+    Attributes:
+        valid_urls: The urls that have already been checked and found valid.
+        pool: The kept alive connections used to check the urls.
+    """
+    MAX_CHECKS = 16
 
     def __init__(self) -> None:
+        from src.models.download import ConnectionPool
+        from src.views.dialog_view import AddSourceDialog
+
         self.view = AddSourceDialog(self)
         self.app_path = get_appdata_path()
-        self.threadPool = QThreadPool()
         self.filepaths = []
         self.downloads = dict()
         self.apply_lock = Lock()
+        self.valid_urls = set()
+        self.pool = ConnectionPool()
 
     def do_start(self) -> None:
         """ Perform startup operations and shows the dialog.
@@ -252,6 +340,22 @@ class SourceDialogController:
         except FileNotFoundError:
             self.view.add_default_source()
 
+    def check_url(self, url: str) -> bool:
+        """ Checks if the url points to an existing pgn file. Only valid urls are cached,
+        so an invalid url is checked again on the next apply.
+        Args:
+            url: The url to be checked.
+        """
+        from src.models.download import check_download
+
+        if url in self.valid_urls:
+            return True
+
+        if check_download(url, pool=self.pool):
+            self.valid_urls.add(url)
+            return True
+        return False
+
     def on_delete_button_clicked(self, source_hbox) -> None:
         """ Removes a source.
         Args:
@@ -296,7 +400,7 @@ class SourceDialogController:
         """ Closes the Source Dialog and performs all the necessary operations depending on
         the user input. These operations are:
             1) Download the pgn files, if any
-            2) Make the games.pgn from all the sources, if there are valid sources.
+            2) Save the sources.
 
         Trigger: User clicks the "OK" Button of the Source Dialog.
         """
@@ -309,10 +413,14 @@ class SourceDialogController:
 
     def on_apply_thread(self) -> None:
         """ Function called by Thread to perform the operations of the on_applyButton_clicked."""
+        from src.models.workers import CheckDownload
+
+        checks = []
+        executor = ThreadPoolExecutor(max_workers=self.MAX_CHECKS)
         download_id = 0
         for source_hbox in self.view.sources:
             if source_hbox.has_url():
-                self.threadPool.start(CheckDownload(self, source_hbox, download_id))
+                checks.append(executor.submit(CheckDownload(self, source_hbox, download_id).run))
                 download_id += 1
             elif source_hbox.has_local():
                 filepath = source_hbox.get_value()
@@ -323,7 +431,8 @@ class SourceDialogController:
                 else:
                     source_hbox.set_status(Status.ERROR)
 
-        self.threadPool.waitForDone()
+        wait(checks)
+        executor.shutdown()
         self.apply_lock.release()
 
         if self.filepaths:
@@ -331,13 +440,11 @@ class SourceDialogController:
 
     def on_exit_thread(self) -> None:
         """ Function called by Thread to perform the operations of the on_okButton_clicked."""
+        from src.models.workers import DownloadGames
+
         download_list_worker = DownloadGames(self.downloads)
         download_list_worker.start()
-        download_list_worker.wait()
-
-        make_pgn_worker = MakePgn(self.filepaths)
-        make_pgn_worker.start()
-        make_pgn_worker.join()
+        download_list_worker.join()
 
         self.save_sources()
 
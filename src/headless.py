@@ -0,0 +1,213 @@
+"""
+Chess Claim Tool: headless
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Runs the claim pipeline without the GUI (and without PyQt) and writes the claims
+as JSON lines, e.g. next to the broadcast relay on a server:
+
+    $ python -m src.headless https://example.com/live.pgn round1.pgn -o claims.jsonl
+"""
+import argparse
+import json
+import os.path
+import signal
+import sys
+from datetime import datetime
+from threading import Event, Lock
+from typing import Dict, List, TextIO, Tuple
+
+from src.helpers import get_appdata_path, Status
+from src.models.cache import AnalysisCache
+from src.models.claims import Claims
+from src.models.download import ConnectionPool, check_download
+from src.models.latency import PassTimes
+from src.models.metrics import MetricsServer
+from src.models.profiler import PROFILER
+from src.models.workers import DownloadGames, Scan, Stop
+
+
+def get_saved_sources() -> List[str]:
+    """ Returns: The sources saved by the GUI (the urls and the local files). """
+    try:
+        with open(os.path.join(get_appdata_path(), "sources.json"), "r") as file:
+            return [entry["value"] for entry in json.load(file)]
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return []
+
+
+def is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def resolve_sources(sources: List[str], data_path: str) -> Tuple[List[str], Dict[str, str], List[str]]:
+    """ Checks the sources and maps every url to the local file it is downloaded to,
+    the same way the Source Dialog does, in the data directory of the headless mode.
+    Returns:
+        The local files to scan, the downloads (url to local file) and the invalid sources.
+    """
+    filepaths = []
+    downloads = {}
+    invalid = []
+    pool = ConnectionPool()
+    try:
+        for source in sources:
+            if is_url(source):
+                if not check_download(source, pool=pool):
+                    invalid.append(source)
+                    continue
+                downloads[source] = os.path.join(data_path, f"games{len(downloads)}.pgn")
+                filepaths.append(downloads[source])
+            elif os.path.exists(source):
+                filepaths.append(source)
+            else:
+                invalid.append(source)
+    finally:
+        pool.close()
+    return filepaths, downloads, invalid
+
+
+class JsonLinesWriter:
+    """ Writes the claims as JSON lines, one object per claim.
+    Attributes:
+        file: The output stream.
+    """
+    __slots__ = ["file"]
+
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    def write_entries(self, entries: list, times: PassTimes = None) -> None:
+        """ Writes a batch of claims, with the seconds since the arrival of their source (the latency). """
+        now = datetime.now()
+        timestamp = now.isoformat(timespec="seconds")
+        for entry in entries:
+            claim_type, board_number, players, move, game_key = entry
+            line = {"timestamp": timestamp, "type": claim_type.value, "event": game_key.event,
+                    "round": game_key.round, "board": board_number, "players": players, "move": move}
+            if times and game_key.source in times.arrived:
+                line["latency"] = round(now.timestamp() - times.arrived[game_key.source], 3)
+            self.file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+
+def print_download_status(status: Status) -> None:
+    if status is Status.ERROR:
+        print("Download failed for at least one source", file=sys.stderr)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.headless",
+                                     description="Scans live pgns for draw claims without the GUI.")
+    parser.add_argument("sources", nargs="*",
+                        help="Urls and local pgn files. Defaults to the sources saved by the GUI.")
+    parser.add_argument("-o", "--output", help="The JSON lines file the claims are appended to. Defaults to stdout.")
+    parser.add_argument("--workers", type=int, default=1, help="The number of processes that check the games.")
+    parser.add_argument("--live-only", action="store_true", help="Check only the games that are still running.")
+    parser.add_argument("--once", action="store_true", help="Download and scan the sources once, then exit.")
+    parser.add_argument("--data-dir", default=os.path.join(get_appdata_path(), "headless"),
+                        help="The directory of the downloaded pgns, the analysis cache and the profiles, so the "
+                             "headless mode does not overwrite the files of the GUI. Runs at the same time need "
+                             "their own directory. Defaults to the headless directory of the application data.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Analyse every game from the first move, instead of resuming the previous run. "
+                             "The claims of the previous run are then written again.")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve the metrics of the workers on this port of localhost (/metrics and /metrics.json).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the downloads and the scan, the pstats files are saved in the data directory.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    data_path = args.data_dir
+    os.makedirs(data_path, exist_ok=True)
+
+    filepaths, downloads, invalid = resolve_sources(args.sources or get_saved_sources(), data_path)
+    for source in invalid:
+        print(f"Invalid source: {source}", file=sys.stderr)
+    if not filepaths:
+        print("No valid sources", file=sys.stderr)
+        return 1
+
+    metrics_server = None
+    if args.metrics_port:
+        try:
+            metrics_server = MetricsServer(args.metrics_port)
+        except OSError as error:
+            print(f"The metrics cannot be served on port {args.metrics_port}: {error}", file=sys.stderr)
+            return 1
+        metrics_server.start()
+
+    output = None
+    try:
+        output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+        writer = JsonLinesWriter(output)
+        # The claims restored from the cache were written by the previous run.
+        claims = Claims(None if args.no_cache else AnalysisCache(os.path.join(data_path, AnalysisCache.FILENAME)),
+                        restored_delivered=True)
+
+        if args.profile:
+            PROFILER.start()
+
+        # The first download is complete before the first scan, like in the GUI.
+        download_worker = DownloadGames(downloads, on_status=print_download_status)
+        download_worker.start()
+        download_worker.join()
+
+        if args.once:
+            Scan(claims, filepaths, None, lambda: args.live_only, None, args.workers,
+                 on_entries=writer.write_entries).run()
+            return 0
+
+        stop_event = Event()
+        lock = Lock()
+        download_worker = None
+        if downloads:
+            download_worker = DownloadGames(downloads, stop_event, lock, on_status=print_download_status)
+            download_worker.start()
+
+        scan_worker = Scan(claims, filepaths, lock, lambda: args.live_only, stop_event, args.workers,
+                           on_entries=writer.write_entries)
+        scan_worker.start()
+
+        stopped = Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopped.set())
+        while not stopped.wait(1):
+            pass
+
+        stop_worker = Stop(stop_event, scan_worker, download_worker)
+        stop_worker.start()
+        stop_worker.join()
+        return 0
+    finally:
+        if output and output is not sys.stdout:
+            output.close()
+        if metrics_server:
+            metrics_server.stop()
+        if args.profile:
+            profiles = PROFILER.stop(os.path.join(data_path, "profiles"))
+            for path in profiles.paths:
+                print(f"Profile saved to {path}", file=sys.stderr)
+            for name, count in profiles.skipped.items():
+                print(f"{count} {name} cycles were not profiled (another profiler was active)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
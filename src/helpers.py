@@ -46,6 +46,8 @@ def get_appdata_path() -> str:
         base_path = os.path.join(os.getenv("HOME"), "Library/Application Support")
     elif platform.system() == "Windows":
         base_path = os.getenv('APPDATA')
+    else:
+        base_path = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local/share")
     return os.path.join(base_path, "Chess Claim Tool")
 
 
@@ -54,4 +56,19 @@ class Status(enum.Enum):
     ERROR = 2
     STOP = 3
     ACTIVE = 4
-    WAIT = 5
\ No newline at end of file
+    WAIT = 5
+
+
+class ClaimType(enum.Enum):
+    THREEFOLD = "3 Fold Repetition"
+    FIVEFOLD = "5 Fold Repetition"
+    FIFTY_MOVES = "50 Moves Rule"
+    SEVENTYFIVE_MOVES = "75 Moves Rule"
+
+    @property
+    def family(self) -> str:
+        """ The claims of the same family replace each other, e.g. a 5 Fold Repetition
+        replaces the 3 Fold Repetition of the same game. """
+        if self is ClaimType.THREEFOLD or self is ClaimType.FIVEFOLD:
+            return "repetition"
+        return "moves"
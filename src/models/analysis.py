@@ -0,0 +1,204 @@
+"""
+Chess Claim Tool: analysis
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import codecs
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from io import StringIO
+from typing import Dict, List, Optional, Tuple
+from zlib import crc32
+
+from chess.pgn import TAG_REGEX, Headers
+from src.models.cache import AnalysisCache
+from src.models.claims import Claims
+from src.models.mainline import read_mainline
+from src.models.metrics import METRICS, Key
+from src.models.profiler import PROFILER, profile_call
+from src.models.reader import decode_game
+
+PLAYER_TAG = re.compile(rb'\[(?:White|Black)[ \t]+"([^"]*)"')
+TAG = re.compile(TAG_REGEX.pattern.encode())
+
+# The Claims of a worker process of the ProcessAnalysis.
+worker_claims: Optional[Claims] = None
+
+
+def analyse_games(claims: Claims, raw_games: List[Tuple[str, bytes]], live_only: bool) -> List[tuple]:
+    """ Parses and checks a list of games for claims.
+    Args:
+        claims: The Claims that keeps the state of the analysed games.
+        raw_games: The source and the raw bytes of the games to be checked.
+        live_only: If True, the games that have already finished are skipped.
+    Returns:
+        The new entries found in the games.
+    """
+    entries = []
+    for source, raw_game in raw_games:
+        # The finished and the excluded games are skipped by their headers, before their moves are parsed.
+        headers = read_headers(raw_game)
+        if live_only and headers["Result"] != "*":
+            continue
+
+        if claims.get_game_key(headers, source) in claims.dont_check:
+            continue
+
+        digest = blake2b(raw_game, digest_size=16).digest()
+        cached_entries = claims.resume_game(source, digest, live_only)
+        if cached_entries is not None:
+            entries.extend(cached_entries)
+            continue
+
+        game = read_mainline(StringIO(decode_game(raw_game)))
+        if not game:
+            continue
+        METRICS.inc("chessclaim_games_parsed_total")
+
+        # A game without a Result tag takes its result from the movetext.
+        if live_only and game.headers["Result"] != "*":
+            continue
+
+        entries.extend(claims.check_game(game, source, digest))
+
+    claims.commit()
+    return entries
+
+
+def read_headers(raw_game: bytes) -> Headers:
+    """ Reads the tag section of a raw game, the way read_game does, without parsing its moves.
+    Args:
+        raw_game: The raw bytes of the game.
+    Returns:
+        The headers of the game, the Seven Tag Roster defaults for the missing tags.
+    """
+    headers = Headers()
+    position = len(codecs.BOM_UTF8) if raw_game.startswith(codecs.BOM_UTF8) else 0
+    while position < len(raw_game):
+        end = raw_game.find(b"\n", position)
+        if end < 0:
+            end = len(raw_game)
+        line = raw_game[position:end].strip()
+        position = end + 1
+
+        if not line or line.startswith((b"%", b";")):
+            continue
+        if not line.startswith(b"["):
+            break
+
+        match = TAG.match(line)
+        if match:
+            headers[match.group(1).decode()] = decode_game(match.group(2))
+    return headers
+
+
+def init_worker(cache_path: Optional[str], restored_delivered: bool) -> None:
+    global worker_claims
+    worker_claims = Claims(AnalysisCache(cache_path) if cache_path else None, restored_delivered)
+    # Only the counters of this worker are sent back with its shards.
+    METRICS.take()
+
+
+def analyse_shard(raw_games: List[Tuple[str, bytes]], live_only: bool,
+                  profile: bool = False) -> Tuple[List[tuple], Dict[Key, float], Optional[dict]]:
+    """ Returns: The new entries of the games, the counters of the worker process since its previous shard
+    and the profile stats of the shard (if it was profiled).
+    """
+    if profile:
+        entries, stats = profile_call(analyse_games, worker_claims, raw_games, live_only)
+    else:
+        entries, stats = analyse_games(worker_claims, raw_games, live_only), None
+    return entries, METRICS.take(), stats
+
+
+class SerialAnalysis:
+    """ Checks the games in the calling thread.
+    Attributes:
+        claims: The Claims that keeps the state of the analysed games.
+    """
+    __slots__ = ["claims"]
+
+    def __init__(self, claims: Claims):
+        self.claims = claims
+
+    def start(self) -> None:
+        pass
+
+    def analyse(self, raw_games: List[Tuple[str, bytes]], live_only: bool) -> List[tuple]:
+        return analyse_games(self.claims, raw_games, live_only)
+
+    def shutdown(self) -> None:
+        pass
+
+
+class ProcessAnalysis:
+    """ Checks the games on a pool of worker processes. The games are sharded by
+    their players, so every game is always checked by the same worker and the
+    worker can resume the game from the last analysed ply.
+
+    Attributes:
+        executors: One single-process executor per shard.
+    """
+    __slots__ = ["executors"]
+
+    def __init__(self, workers: int, cache_path: str = None, restored_delivered: bool = False):
+        # The workers are spawned, a fork of the (multi-threaded) application could copy a lock that another
+        # thread holds (e.g. the lock of METRICS) and the worker would wait for it forever.
+        context = multiprocessing.get_context("spawn")
+        self.executors = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=init_worker,
+                                              initargs=(cache_path, restored_delivered))
+                          for _ in range(workers)]
+
+    def start(self) -> None:
+        """ Starts all the worker processes, so the first scan does not wait for them. """
+        for future in [executor.submit(analyse_shard, [], False) for executor in self.executors]:
+            future.result()
+
+    def analyse(self, raw_games: List[Tuple[str, bytes]], live_only: bool) -> List[tuple]:
+        shards = [[] for _ in self.executors]
+        for source, raw_game in raw_games:
+            shards[self.get_shard(raw_game)].append((source, raw_game))
+
+        # The analysis runs in the worker processes, so it is profiled there.
+        profile = PROFILER.enabled
+        futures = [executor.submit(analyse_shard, shard, live_only, profile)
+                   for executor, shard in zip(self.executors, shards) if shard]
+
+        entries = []
+        for future in futures:
+            shard_entries, counters, stats = future.result()
+            entries.extend(shard_entries)
+            METRICS.add(counters)
+            if profile:
+                PROFILER.add("analysis", stats)
+        return entries
+
+    def get_shard(self, raw_game: bytes) -> int:
+        """ Returns: The index of the worker that checks the game, based on its players. """
+        return crc32(b"".join(PLAYER_TAG.findall(raw_game[:4096]))) % len(self.executors)
+
+    def shutdown(self) -> None:
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
+
+
+def make_analysis(claims: Claims, workers: int):
+    """ Returns: The SerialAnalysis for a single worker, the ProcessAnalysis otherwise. """
+    if workers <= 1:
+        return SerialAnalysis(claims)
+    return ProcessAnalysis(workers, claims.cache.path if claims.cache else None, claims.restored_delivered)
@@ -0,0 +1,201 @@
+"""
+Chess Claim Tool: AnalysisCache
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from hashlib import blake2b
+from time import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING, Union
+
+from chess import Move
+from src.helpers import ClaimType
+from src.models.claims import GameKey
+
+if TYPE_CHECKING:
+    from src.models.claims import GameCursor
+
+
+def hash_moves(moves: Sequence[Move]) -> bytes:
+    """ Returns: The hash of a sequence of moves (e.g. the moves of a game analysed so far). """
+    return blake2b(" ".join(move.uci() for move in moves).encode(), digest_size=16).digest()
+
+
+class CachedGame(NamedTuple):
+    """ The analysis of a game as it was stored in the cache.
+    Attributes:
+        game_key: The key of the game (not interned).
+        ply: The number of moves that were analysed.
+        prefix_hash: The hash of the moves that were analysed.
+        fen: The position after the analysed moves.
+        positions: The number of times every position occurred since the last irreversible move.
+        entries: The claims of the game (claim type, board number, players, move).
+        finished: True if the game does not have to be checked again (5 Fold Repetition, 75 Moves Rule).
+        live: True if the game was still running.
+    """
+    game_key: GameKey
+    ply: int
+    prefix_hash: bytes
+    fen: str
+    positions: dict
+    entries: List[tuple]
+    finished: bool
+    live: bool
+
+
+class AnalysisCache:
+    """ Keeps the analysis of every game on disk (SQLite), so a stop/start of the scan
+    or a restart of the application resumes the games instead of analysing them from
+    the first move. A game is stored by its GameKey (source included), together with the hash
+    of the moves analysed so far and the hash of its raw content:
+        - A game whose raw content did not change since it was stored is not even parsed,
+          its claims are taken from the cache.
+        - A game whose first moves still match the stored ones resumes from the stored
+          position, only the new moves are analysed.
+    The stores are written in one transaction per pass (see commit).
+
+    Attributes:
+        path: The path of the database.
+        connection: The connection to the database, opened on first use.
+        pending: The games stored since the last commit.
+        disabled: True if the database could not be used.
+    """
+    FILENAME = "analysis.sqlite3"
+    MAX_AGE = 7 * 24 * 60 * 60
+    VERSION = 2
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            source TEXT NOT NULL,
+            game_key TEXT NOT NULL,
+            digest BLOB NOT NULL,
+            ply INTEGER NOT NULL,
+            prefix_hash BLOB NOT NULL,
+            fen TEXT NOT NULL,
+            positions TEXT NOT NULL,
+            entries TEXT NOT NULL,
+            finished INTEGER NOT NULL,
+            live INTEGER NOT NULL,
+            updated REAL NOT NULL,
+            PRIMARY KEY (source, game_key)
+        );
+        CREATE INDEX IF NOT EXISTS games_digest ON games (source, digest);
+    """
+    COLUMNS = "game_key, ply, prefix_hash, fen, positions, entries, finished, live"
+    __slots__ = ["path", "connection", "pending", "disabled"]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.pending = []
+        self.disabled = False
+
+    def connect(self) -> Optional[sqlite3.Connection]:
+        """ Returns: The connection to the database, None if the database cannot be used. """
+        if self.connection or self.disabled:
+            return self.connection
+
+        try:
+            # The scan thread that uses the connection changes on every start of the scan.
+            self.connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            with self.connection:
+                # The games stored by an older version cannot be resumed.
+                if self.connection.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+                    self.connection.execute("DROP TABLE IF EXISTS games")
+                    self.connection.execute(f"PRAGMA user_version = {self.VERSION}")
+                self.connection.executescript(self.SCHEMA)
+                self.connection.execute("DELETE FROM games WHERE updated < ?", (time() - self.MAX_AGE,))
+        except sqlite3.Error:
+            self.close()
+            self.disabled = True
+        return self.connection
+
+    def find(self, source: str, digest: bytes) -> Optional[CachedGame]:
+        """ Returns: The game of the source with the given raw content, if it is stored. """
+        return self.select(f"SELECT {self.COLUMNS} FROM games WHERE source = ? AND digest = ?", (source, digest))
+
+    def load(self, game_key: GameKey, moves: Sequence[Move]) -> Optional[CachedGame]:
+        """ Returns: The stored game, if the moves it was analysed up to are still the first moves of the game.
+        Args:
+            game_key: The key of the game.
+            moves: The mainline moves of the game as it is now.
+        """
+        cached = self.select(f"SELECT {self.COLUMNS} FROM games WHERE source = ? AND game_key = ?",
+                             (game_key.source, self.dump_key(game_key)))
+        if cached is None or cached.ply > len(moves) or hash_moves(moves[:cached.ply]) != cached.prefix_hash:
+            return None
+        return cached
+
+    def select(self, query: str, parameters: Tuple[str, Union[str, bytes]]) -> Optional[CachedGame]:
+        """ Returns: The game found by the query, the first parameter of the query is the source. """
+        connection = self.connect()
+        if not connection:
+            return None
+
+        try:
+            row = connection.execute(query, parameters).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+
+        game_key, ply, prefix_hash, fen, positions, entries, finished, live = row
+        return CachedGame(GameKey(*json.loads(game_key), parameters[0]), ply, prefix_hash, fen,
+                          {int(key): count for key, count in json.loads(positions)},
+                          [(ClaimType[claim_type], *rest) for claim_type, *rest in json.loads(entries)],
+                          bool(finished), bool(live))
+
+    @staticmethod
+    def dump_key(game_key: GameKey) -> str:
+        """ Returns: The key of the game without its source (it has its own column). """
+        return json.dumps(game_key[:-1], ensure_ascii=False)
+
+    def store(self, game_key: GameKey, digest: bytes, cursor: GameCursor, finished: bool, live: bool) -> None:
+        """ Stores the analysis of a game, it is written on the next commit.
+        Args:
+            game_key: The key of the game.
+            digest: The hash of the raw content of the game.
+            cursor: The cursor of the game, after its analysis.
+            finished: True if the game does not have to be checked again.
+            live: True if the game is still running.
+        """
+        positions = json.dumps(list(cursor.positions.items()))
+        entries = json.dumps([(entry[0].name, *entry[1:4]) for entry in cursor.entries])
+        self.pending.append((game_key.source, self.dump_key(game_key), digest, cursor.ply, hash_moves(cursor.moves),
+                             cursor.board.fen(), positions, entries, int(finished), int(live), time()))
+
+    def commit(self) -> None:
+        """ Writes the games stored since the last commit. """
+        pending, self.pending = self.pending, []
+        connection = self.connect() if pending else None
+        if not connection:
+            return
+
+        try:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       pending)
+        except sqlite3.Error:
+            pass
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
@@ -16,74 +16,332 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-from enum import Enum
+from __future__ import annotations
+
 from math import ceil
+from typing import Dict, List, NamedTuple, Optional, TYPE_CHECKING, Union
+
+from chess import Board, Move, square_file
+from chess.pgn import Game, Headers
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY, ZobristHasher
+from src.helpers import ClaimType
+from src.models.metrics import METRICS
 
-from chess.pgn import Game
+if TYPE_CHECKING:
+    from src.models.cache import AnalysisCache, CachedGame
+    from src.models.mainline import MainlineGame
 
+    # The games are either read by read_game or, without their GameNode tree, by read_mainline.
+    AnyGame = Union[Game, MainlineGame]
 
-def get_players(game: Game) -> str:
+
+def get_players(game: AnyGame) -> str:
     white = game.headers["White"][:22]
     black = game.headers["Black"][:22]
     return f"{white} - {black}"
 
 
+class GameKey(NamedTuple):
+    """ The identity of a game. The (truncated) players are only for display, two games
+    of an open or of a double round robin may have the same players.
+    The keys are interned by the Claims, so all the entries of a game share one key.
+    """
+    event: str
+    round: str
+    board: str
+    white: str
+    black: str
+    source: str
+
+
+class RepetitionHasher(ZobristHasher):
+    """ Zobrist hashing of a position that matches the way python-chess compares positions
+    for repetitions: the en passant square only counts when en passant is legal. """
+
+    def hash_ep_square(self, board: Board) -> int:
+        if board.has_legal_en_passant():
+            return self.array[772 + square_file(board.ep_square)]
+        return 0
+
+
+zobrist_hash = RepetitionHasher(POLYGLOT_RANDOM_ARRAY)
+
+
+class GameCursor:
+    """ The analysis state of a game between two scans.
+    Attributes:
+        board: The live board of the game, with every analysed move pushed.
+        ply: The number of moves (half-moves) that have already been analysed.
+        positions: The number of times every position occurred since the last
+        irreversible move, keyed by the Zobrist hash of the position.
+        moves: The moves that have already been analysed.
+        entries: The claims of the game so far.
+    """
+    __slots__ = ["board", "ply", "positions", "moves", "entries"]
+
+    def __init__(self, board: Board):
+        self.board = board
+        self.ply = 0
+        self.positions: Dict[int, int] = {zobrist_hash(board): 1}
+        self.moves: List[Move] = []
+        self.entries: List[tuple] = []
+
+    @classmethod
+    def restore(cls, board: Board, cached: CachedGame, moves: List[Move], game_key: GameKey) -> GameCursor:
+        """ Returns: The cursor of a game stored in the AnalysisCache.
+        Args:
+            board: The starting position of the game, set to the stored position.
+            cached: The stored analysis of the game.
+            moves: The moves that had been analysed.
+            game_key: The interned key of the game.
+        """
+        board.set_fen(cached.fen)
+        cursor = cls(board)
+        cursor.ply = cached.ply
+        cursor.positions = cached.positions
+        cursor.moves = moves
+        cursor.entries = [entry + (game_key,) for entry in cached.entries]
+        return cursor
+
+    def push(self, move: Move) -> int:
+        """ Pushes the move to the board.
+        Returns:
+            The number of times the new position has occurred in the game.
+        """
+        # No position before an irreversible move (pawn move, capture, loss of castling
+        # rights or en passant) can occur again.
+        if self.board.is_irreversible(move):
+            self.positions.clear()
+
+        self.board.push(move)
+        self.moves.append(move)
+        self.ply += 1
+
+        key = zobrist_hash(self.board)
+        repetitions = self.positions.get(key, 0) + 1
+        self.positions[key] = repetitions
+        return repetitions
+
+
 class Claims:
     """
     Attributes:
-        dont_check(list): Is a list of player's names who's their game shall not
-        be checked again. This list is used for games that a 5 Fold Repetition
-        or 75 Moves Rule occurred.
-        entries(list): The list of entries. Each element of entries lists
-        is a list ([str,str,str,str]).
+        dont_check(set): The GameKeys of the games that shall not be checked again,
+        the games in which a 5 Fold Repetition or a 75 Moves Rule occurred.
+        entries(set): The entries delivered so far. Each entry is a tuple
+        (claim type, board number, players, move, game key). The entries of
+        the games in dont_check are dropped, those games are not checked again.
+        cursors(dict): The GameCursor of every game analysed so far, keyed by the
+        GameKey of the game. A rescan only checks the moves after the cursor.
+        cache(AnalysisCache): Keeps the cursors on disk between the scans, if provided.
+        keys(dict): The interned GameKeys, of the games that are still checked.
+        restored_delivered(bool): If True, the entries restored from the cache are
+        marked as delivered and not returned again (e.g. the headless mode wrote
+        them in a previous run), only the claims found since are new.
     """
 
-    def __init__(self):
+    def __init__(self, cache: AnalysisCache = None, restored_delivered: bool = False):
         self.dont_check = set()
         self.entries = set()
+        self.cursors: Dict[GameKey, GameCursor] = dict()
+        self.cache = cache
+        self.keys: Dict[GameKey, GameKey] = dict()
+        self.restored_delivered = restored_delivered
 
-    def check_game(self, game: Game) -> set:
+    def check_game(self, game: AnyGame, source: str = "", digest: bytes = b"") -> list:
         """ Checks the game for 3 Fold Repetitions, 5 Fold Repetitions, 50 Move Draw Rule and for the 75 Move Draw Rule.
+        Only the moves played since the previous check of the same game are analysed.
         Args:
             game: The game to be checked.
+            source: The source of the game, used by the cache.
+            digest: The hash of the raw content of the game, used by the cache.
+        Returns:
+            The new entries of the game, in the order of the moves.
+        """
+        game_key = self.get_game_key(game.headers, source)
+        live = game.headers["Result"] == "*"
+        finished = False
+
+        cursor = self.cursors.get(game_key)
+        moves = list(game.mainline_moves())
+        if cursor is None or not self.is_prefix(cursor, moves):
+            cursor, finished = self.get_cursor(game, game_key, moves)
+            self.cursors[game_key] = cursor
+        if not finished:
+            METRICS.inc("chessclaim_plies_analysed_total", len(moves) - cursor.ply)
+            finished = self.check_moves(cursor, moves[cursor.ply:], game, game_key)
+        return self.finish_game(game_key, digest, cursor, finished, live)
+
+    def check_moves(self, cursor: GameCursor, moves: List[Move], game: AnyGame, game_key: GameKey) -> bool:
+        """ Pushes the new moves of a game to its cursor and adds their claims to the cursor.
+        Returns:
+            True if the game does not have to be checked again (5 Fold Repetition, 75 Moves Rule).
         """
-        move_counter = 0
-        board = game.board()
-        players = get_players(game)
         board_number = self.get_board_number(game)
-        game_entries = set()
+        players = get_players(game)
+        for move in moves:
+            if self.check_move(cursor, move, board_number, players, game_key):
+                return True
+        return False
 
-        # Loop to go through of all the moves of the game.
-        for move in game.mainline_moves():
-            san_move = str(board.san(move))
-            board.push(move)
+    def check_move(self, cursor: GameCursor, move: Move, board_number: str, players: str, game_key: GameKey) -> bool:
+        """ Pushes a move of a game to its cursor and adds its claims to the cursor.
+        The move text is only made for the claims.
+        Returns:
+            True if the game does not have to be checked again (5 Fold Repetition, 75 Moves Rule).
+        """
+        board = cursor.board
+        repetitions = cursor.push(move)
+
+        if repetitions >= 5:
+            cursor.entries.append((ClaimType.FIVEFOLD, board_number, players,
+                                   self.get_last_move(board, cursor.ply), game_key))
+            return True
+        if board.is_seventyfive_moves():
+            cursor.entries.append((ClaimType.SEVENTYFIVE_MOVES, board_number, players,
+                                   self.get_last_move(board, cursor.ply), game_key))
+            return True
+        if board.is_fifty_moves():
+            cursor.entries.append((ClaimType.FIFTY_MOVES, board_number, players,
+                                   self.get_last_move(board, cursor.ply), game_key))
+        if repetitions >= 3:
+            cursor.entries.append((ClaimType.THREEFOLD, board_number, players,
+                                   self.get_last_move(board, cursor.ply), game_key))
+        return False
+
+    def finish_game(self, game_key: GameKey, digest: bytes, cursor: GameCursor, finished: bool, live: bool) -> list:
+        """ Stores the analysis of a checked game.
+        Args:
+            game_key: The key of the game.
+            digest: The hash of the raw content of the game, used by the cache.
+            cursor: The cursor of the game, after its analysis.
+            finished: True if the game does not have to be checked again.
+            live: True if the game is still running.
+        Returns:
+            The new entries of the game, in the order of the moves.
+        """
+        if self.cache:
+            self.cache.store(game_key, digest, cursor, finished, live)
+        new_entries = self.get_new_entries(cursor.entries)
+        if finished:
+            self.cursors.pop(game_key, None)
+            self.evict(game_key, cursor.entries)
+        return new_entries
+
+    def get_cursor(self, game: AnyGame, game_key: GameKey, moves: List[Move]):
+        """ Returns: The cursor of the game from the cache if its analysed moves are still the first
+        moves of the game, a new cursor otherwise. Also whether the game does not have to be checked again.
+        """
+        cached = self.cache.load(game_key, moves) if self.cache else None
+        if cached is None:
+            return GameCursor(game.board()), False
+        cursor = GameCursor.restore(game.board(), cached, moves[:cached.ply], game_key)
+        if self.restored_delivered:
+            self.entries.update(cursor.entries)
+        return cursor, cached.finished
+
+    def resume_game(self, source: str, digest: bytes, live_only: bool) -> Optional[list]:
+        """ Takes the claims of a game from the cache, if the game did not change since it was stored.
+        Args:
+            source: The source of the game.
+            digest: The hash of the raw content of the game.
+            live_only: If True, the games that have already finished are skipped.
+        Returns:
+            The new entries of the game, None if the game has to be parsed and checked.
+        """
+        cached = self.cache.find(source, digest) if self.cache else None
+        if cached is None:
+            return None
+
+        game_key = self.intern(cached.game_key)
+        if (live_only and not cached.live) or game_key in self.dont_check:
+            return []
+        game_entries = [entry + (game_key,) for entry in cached.entries]
+        if self.restored_delivered:
+            self.entries.update(game_entries)
+        new_entries = self.get_new_entries(game_entries)
+        if cached.finished:
+            self.evict(game_key, game_entries)
+        return new_entries
+
+    def get_game_key(self, headers: Headers, source: str = "") -> GameKey:
+        """ Returns: The interned key of the game.
+        Args:
+            headers: The headers of the game.
+            source: The source of the game.
+        """
+        return self.intern(GameKey(headers.get("Event", ""), headers.get("Round", ""), headers.get("Board", ""),
+                                   headers.get("White", ""), headers.get("Black", ""), source))
+
+    def intern(self, game_key: GameKey) -> GameKey:
+        interned = self.keys.get(game_key)
+        if interned is None:
+            # The finished games are only looked up in dont_check, they are not interned again.
+            if game_key in self.dont_check:
+                return game_key
+            interned = self.keys.setdefault(game_key, game_key)
+        return interned
 
-            move_counter += 1
-            printable_move = self.get_printable_move(move_counter, san_move)
-
-            if board.is_fivefold_repetition():
-                game_entries.add((ClaimType.FIVEFOLD, board_number, players, printable_move))
-                self.dont_check.add(players)
-                break
-            if board.is_seventyfive_moves():
-                game_entries.add((ClaimType.SEVENTYFIVE_MOVES, board_number, players, printable_move))
-                self.dont_check.add(players)
-                break
-            if board.is_fifty_moves():
-                game_entries.add((ClaimType.FIFTY_MOVES, board_number, players, printable_move))
-            if board.is_repetition(count=3):
-                game_entries.add((ClaimType.THREEFOLD, board_number, players, printable_move))
-
-        game_entries = game_entries - self.entries
+    def evict(self, game_key: GameKey, game_entries: List[tuple]) -> None:
+        """ Marks a game as finished and drops its delivered entries and its key, the game is
+        skipped by its key in dont_check from now on, so they are not needed again.
+        """
+        self.dont_check.add(game_key)
+        self.entries.difference_update(game_entries)
+        self.keys.pop(game_key, None)
+
+    def get_new_entries(self, game_entries: List[tuple]) -> List[tuple]:
+        """ Returns: The entries that have not been delivered yet, they are marked as delivered. """
+        game_entries = [entry for entry in game_entries if entry not in self.entries]
         self.entries.update(game_entries)
         return game_entries
 
+    def commit(self) -> None:
+        """ Writes the analysis of the games checked since the last commit to the cache. """
+        if self.cache:
+            self.cache.commit()
+
     def empty_dont_check(self) -> None:
         self.dont_check.clear()
 
     def empty_entries(self) -> None:
         self.entries.clear()
 
+    def empty_cursors(self) -> None:
+        self.cursors.clear()
+
+    @staticmethod
+    def is_prefix(cursor: GameCursor, moves) -> bool:
+        """ Returns: True if the moves analysed by the cursor are still the first moves
+        of the game, False if the game got shorter or one of its moves was corrected.
+        Args:
+            cursor: The cursor of the game from the previous scan.
+            moves: The mainline moves of the game as it is in the current scan.
+        """
+        analysed = cursor.moves
+        ply = 0
+        for move in moves:
+            if ply == cursor.ply:
+                return True
+            if move != analysed[ply]:
+                return False
+            ply += 1
+        return ply == cursor.ply
+
+    def get_last_move(self, board: Board, move_counter: int) -> str:
+        """ Returns: The last move pushed to the board as it's been displayed in the view.
+        The SAN of the move is made from the position before the move.
+        Args:
+            board: The board of the game.
+            move_counter: The number of the moves played in the game.
+        """
+        move = board.pop()
+        try:
+            san_move = board.san(move)
+        finally:
+            board.push(move)
+        return self.get_printable_move(move_counter, san_move)
+
     @staticmethod
     def get_printable_move(move_counter: int, san_move: str) -> str:
         """ Returns: The move as it's been displayed in the view.
@@ -100,16 +358,10 @@ class Claims:
         return move
 
     @staticmethod
-    def get_board_number(game: Game) -> str:
+    def get_board_number(game: AnyGame) -> str:
         if "Board" in game.headers:
             return str(game.headers["Board"])
         if "Round" in game.headers:
             return str(game.headers["Round"])
         return "-"
 
-
-class ClaimType(Enum):
-    THREEFOLD = "3 Fold Repetition"
-    FIVEFOLD = "5 Fold Repetition"
-    FIFTY_MOVES = "50 Moves Rule"
-    SEVENTYFIVE_MOVES = "75 Moves Rule"
@@ -16,33 +16,379 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import ssl
+from collections import defaultdict
+from hashlib import blake2b
+from http.client import HTTPConnection, HTTPException, HTTPSConnection, HTTPResponse
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.error import URLError
+from urllib.parse import urljoin, urlsplit
 
-import urllib.request
-from urllib.error import HTTPError, URLError
 import certifi
+from src.models.metrics import METRICS
 
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+CHECK_BYTES = 16
 
-def check_download(url: str, timeout=4) -> bool:
-    """ Checks if the url points to an existing pgn file.
+
+class Response(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class DownloadResult(NamedTuple):
+    """ The result of a conditional download.
+    Attributes:
+        ok: False if the download failed.
+        data: The new content of the source, None if it did not change since the previous download.
+        append: If True, data is only the part appended to the source since the previous download.
+    """
+    ok: bool
+    data: Optional[bytes] = None
+    append: bool = False
+
+
+class ConnectionPool:
+    """ Keeps the connections to the web sources alive between the downloads, so every
+    download does not pay for a new TCP and TLS handshake. The idle connections are
+    kept per host and a connection is only used by one thread at a time.
+
+    Attributes:
+        ssl_context: The ssl context of the https connections.
+        idle: The idle connections of every (scheme, host, port).
+        lock: Guards the idle connections.
+    """
+    CHUNK_SIZE = 64 * 1024
+    MAX_REDIRECTS = 5
+    __slots__ = ["ssl_context", "idle", "lock"]
+
+    def __init__(self):
+        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self.idle: Dict[Tuple[str, str, int], List[HTTPConnection]] = defaultdict(list)
+        self.lock = Lock()
+
+    def request(self, method: str, url: str, headers: Dict[str, str] = None, timeout: float = 10,
+                limit: int = None) -> Response:
+        """ Sends a request and follows the redirects.
+        Args:
+            method: The http method of the request.
+            url: The url of the request.
+            headers: Additional headers of the request.
+            timeout: The time in seconds the whole request may take, redirects included.
+            limit: The maximum number of body bytes to read, the rest of the body is discarded.
+        Returns:
+            The final response.
+        Raises:
+            URLError: The url is invalid or the request failed.
+            TimeoutError: The request took longer than the timeout.
+        """
+        deadline = monotonic() + timeout
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self.send(method, url, headers or {}, deadline, limit)
+            if response.status not in REDIRECT_CODES or "location" not in response.headers:
+                return response
+            url = urljoin(url, response.headers["location"])
+        raise URLError("Too many redirects")
+
+    def send(self, method: str, url: str, headers: Dict[str, str], deadline: float, limit: int = None) -> Response:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise URLError(f"Unsupported url: {url}")
+
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        # A kept alive connection may have been closed by the server, so it is retried once with a new one.
+        connection, reused = self.acquire(key, deadline)
+        try:
+            return self.send_on(connection, method, path, headers, deadline, limit)
+        except (HTTPException, OSError) as error:
+            connection.close()
+            if not reused or isinstance(error, TimeoutError):
+                raise URLError(error)
+
+        connection = self.connect(key, deadline)
+        try:
+            return self.send_on(connection, method, path, headers, deadline, limit)
+        except (HTTPException, OSError) as error:
+            connection.close()
+            raise URLError(error)
+
+    def send_on(self, connection: HTTPConnection, method: str, path: str, headers: Dict[str, str],
+                deadline: float, limit: int = None) -> Response:
+        connection.timeout = max(deadline - monotonic(), 0.1)
+        if connection.sock:
+            connection.sock.settimeout(connection.timeout)
+
+        connection.request(method, path, headers=headers)
+        response = connection.getresponse()
+        body = self.read_body(response, deadline, limit)
+
+        # A connection with an unread body left cannot be reused.
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self.release(connection)
+        return Response(response.status, {name.lower(): value for name, value in response.getheaders()}, body)
+
+    def read_body(self, response: HTTPResponse, deadline: float, limit: int = None) -> bytes:
+        chunks = []
+        size = 0
+        while limit is None or size < limit:
+            chunk = response.read(self.CHUNK_SIZE if limit is None else min(self.CHUNK_SIZE, limit - size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+            if monotonic() > deadline:
+                raise TimeoutError("The download took longer than the timeout")
+        return b"".join(chunks)
+
+    def acquire(self, key: Tuple[str, str, int], deadline: float) -> Tuple[HTTPConnection, bool]:
+        """ Returns: An idle connection to the host if there is one, a new connection otherwise,
+        and whether the connection is reused.
+        """
+        with self.lock:
+            if self.idle[key]:
+                return self.idle[key].pop(), True
+        return self.connect(key, deadline), False
+
+    def connect(self, key: Tuple[str, str, int], deadline: float) -> HTTPConnection:
+        scheme, host, port = key
+        timeout = max(deadline - monotonic(), 0.1)
+        if scheme == "https":
+            return HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+        return HTTPConnection(host, port, timeout=timeout)
+
+    def release(self, connection: HTTPConnection) -> None:
+        with self.lock:
+            self.idle[(self.get_scheme(connection), connection.host, connection.port)].append(connection)
+
+    @staticmethod
+    def get_scheme(connection: HTTPConnection) -> str:
+        return "https" if isinstance(connection, HTTPSConnection) else "http"
+
+    def close(self) -> None:
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+def check_download(url: str, timeout=4, pool: ConnectionPool = None) -> bool:
+    """ Checks if the url points to an existing pgn file, without downloading it. The file
+    is checked with a HEAD request and, for the servers that do not support HEAD, with a
+    GET of its first bytes.
     Args:
-        timeout:
+        timeout: The time in seconds the check may take.
         url(str): The location of the file to check.
+        pool: The pool of the kept alive connections. If not provided, a new connection is used.
     Returns:
         True if successful, False otherwise.
     """
     if not (url.endswith(".pgn")):
         return False
 
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool()
     try:
-        ret_code = urllib.request.urlopen(url, timeout=timeout, cafile=certifi.where()).getcode()
-    except (HTTPError, URLError, ValueError):
+        if pool.request("HEAD", url, timeout=timeout).status == 200:
+            return True
+        response = pool.request("GET", url, {"Range": f"bytes=0-{CHECK_BYTES - 1}"}, timeout, limit=CHECK_BYTES)
+    except (URLError, TimeoutError):
         return False
-    return ret_code == 200
+    finally:
+        if own_pool:
+            pool.close()
+    return response.status in (200, 206)
 
 
-def download_pgn(url: str, timeout=10) -> bytes:
+def download_pgn(url: str, timeout=10, pool: ConnectionPool = None) -> bytes:
+    """ Downloads a pgn file.
+    Args:
+        url: The location of the file to download.
+        timeout: The time in seconds the whole download may take.
+        pool: The pool of the kept alive connections. If not provided, a new connection is used.
+    Returns:
+        The content of the file, empty if the download failed.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool()
     try:
-        response = urllib.request.urlopen(url, timeout=timeout, cafile=certifi.where())
-        return response.read()
-    except (HTTPError, URLError):
+        response = pool.request("GET", url, timeout=timeout)
+    except (URLError, TimeoutError):
+        return bytes()
+    finally:
+        if own_pool:
+            pool.close()
+
+    if response.status != 200:
         return bytes()
+    return response.body
+
+
+class ContentState(NamedTuple):
+    """ The state of the content of a source, as it is in its local file.
+    Attributes:
+        etag: The ETag of the response of the content.
+        last_modified: The Last-Modified of the response of the content.
+        hasher: The running hash of the content.
+        length: The length of the content.
+        tail: The last OVERLAP bytes of the content.
+    """
+    etag: Optional[str]
+    last_modified: Optional[str]
+    hasher: Any
+    length: int
+    tail: bytes
+
+
+class PgnDownload:
+    """ Downloads a web source only when it changed since the previous download. The
+    validators (ETag, Last-Modified) of the previous response are sent with the request,
+    so the server can answer with a 304 (Not Modified) instead of the whole pgn. Servers
+    that ignore them are covered by comparing the hash of the body.
+
+    Live pgns only grow, so once the source is known only its tail is requested
+    (`Range: bytes=<length - OVERLAP>-`). The overlapping bytes must match the end of
+    the previous content, otherwise the source was rewritten and it is downloaded in
+    full. HTTP has no way to check the rest of the previous content without downloading
+    it, so a correction earlier in the source that keeps its length (e.g. a fixed result)
+    is appended over. Every FULL_REFRESH downloads the source is downloaded in full
+    regardless, so such a local pgn is stale for at most FULL_REFRESH cycles of the
+    download (about a minute).
+
+    The state of the content moves forward only once the new content is written to the
+    local file (see commit), a failed write resets the download (see reset).
+
+    Attributes:
+        url: The location of the source.
+        etag: The ETag of the previous response.
+        last_modified: The Last-Modified of the previous response.
+        hasher: The running hash of the content of the source.
+        length: The length of the content of the source.
+        tail: The last OVERLAP bytes of the content of the source.
+        partials: The number of partial downloads since the last full one.
+        received: The number of body bytes received so far.
+        saved: The number of body bytes that were not downloaded thanks to 304 and partial responses.
+        pending: The state of the content after the last download, until it is written.
+    """
+    OVERLAP = 256
+    FULL_REFRESH = 15
+    __slots__ = ["url", "etag", "last_modified", "hasher", "length", "tail", "partials", "received", "saved",
+                 "pending"]
+
+    def __init__(self, url: str):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.hasher = None
+        self.length = 0
+        self.tail = bytes()
+        self.partials = 0
+        self.received = 0
+        self.saved = 0
+        self.pending: Optional[ContentState] = None
+
+    @property
+    def digest(self) -> Optional[bytes]:
+        return self.hasher.digest() if self.hasher else None
+
+    def get_headers(self, ranged: bool) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        if ranged:
+            headers["Range"] = f"bytes={self.length - self.OVERLAP}-"
+        return headers
+
+    def can_range(self) -> bool:
+        return self.length >= self.OVERLAP and self.partials < self.FULL_REFRESH
+
+    def fetch(self, pool: ConnectionPool, timeout=10) -> DownloadResult:
+        """ Returns: The new content of the source, if it changed since the previous download.
+        Args:
+            pool: The pool of the kept alive connections.
+            timeout: The time in seconds the whole download may take.
+        """
+        ranged = self.can_range()
+        try:
+            response = pool.request("GET", self.url, self.get_headers(ranged), timeout)
+            if response.status == 416 or (response.status == 206 and not self.is_continuation(response)):
+                ranged = False
+                response = pool.request("GET", self.url, self.get_headers(ranged), timeout)
+        except (URLError, TimeoutError):
+            METRICS.inc("chessclaim_http_responses_total", status="error")
+            return DownloadResult(False)
+
+        self.received += len(response.body)
+        METRICS.inc("chessclaim_download_bytes_total", len(response.body))
+        METRICS.inc("chessclaim_http_responses_total", status=str(response.status))
+        if response.status == 304:
+            self.saved += self.length
+            return DownloadResult(True)
+        if response.status == 206 and ranged:
+            return self.on_partial(response)
+        if response.status != 200 or not response.body:
+            return DownloadResult(False)
+        return self.on_full(response)
+
+    def is_continuation(self, response: Response) -> bool:
+        """ Returns: True if the partial response starts with the end of the previous content. """
+        content_range = response.headers.get("content-range", "")
+        return (content_range.startswith(f"bytes {self.length - self.OVERLAP}-") and
+                response.body[:self.OVERLAP] == self.tail)
+
+    def on_partial(self, response: Response) -> DownloadResult:
+        self.partials += 1
+
+        delta = response.body[self.OVERLAP:]
+        self.saved += self.length - self.OVERLAP
+        hasher = self.hasher.copy()
+        hasher.update(delta)
+        self.pending = ContentState(response.headers.get("etag"), response.headers.get("last-modified"), hasher,
+                                    self.length + len(delta), (self.tail + delta)[-self.OVERLAP:])
+        if not delta:
+            self.commit()
+            return DownloadResult(True)
+        return DownloadResult(True, delta, append=True)
+
+    def on_full(self, response: Response) -> DownloadResult:
+        self.partials = 0
+
+        hasher = blake2b(response.body, digest_size=16)
+        changed = hasher.digest() != self.digest
+        self.pending = ContentState(response.headers.get("etag"), response.headers.get("last-modified"), hasher,
+                                    len(response.body), response.body[-self.OVERLAP:])
+        if not changed:
+            self.commit()
+            return DownloadResult(True)
+        return DownloadResult(True, response.body)
+
+    def commit(self) -> None:
+        """ Moves the state of the content (validators included) forward, once the new content is written to the
+        local file. Until then a 304 or a matching hash cannot hide content that was never written.
+        """
+        if self.pending:
+            self.etag, self.last_modified, self.hasher, self.length, self.tail = self.pending
+            self.pending = None
+
+    def reset(self) -> None:
+        """ Forgets the content of the source after a failed write, so the next download is a full one. """
+        self.etag = None
+        self.last_modified = None
+        self.hasher = None
+        self.length = 0
+        self.tail = bytes()
+        self.partials = 0
+        self.pending = None
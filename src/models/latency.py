@@ -0,0 +1,130 @@
+"""
+Chess Claim Tool: latency
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import csv
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+# The upper bounds (in seconds) of the buckets of the latency histogram, the last bucket has no bound.
+BUCKETS = (1, 2, 5, 10, 30, 60)
+
+
+class PassTimes(NamedTuple):
+    """ The timestamps (time.time) of a pass of the scan, shared by all the claims found in it.
+    Attributes:
+        arrived: The time every source was last written (e.g. by the download), by source.
+        merged: The time the changed games of all the sources were read.
+        detected: The time the analysis of the changed games finished.
+    """
+    arrived: Dict[str, float]
+    merged: float
+    detected: float
+
+
+class ClaimLatency(NamedTuple):
+    """ The timestamps of a claim, from the arrival of its moves up to its row in the table.
+    Attributes:
+        claim: The claim (claim type, board number, players, move).
+        arrived: The time the source of the claim was written.
+        merged: The time the game of the claim was read from its source.
+        detected: The time the claim was found.
+        displayed: The time the row of the claim was added to the table.
+    """
+    claim: Tuple[str, str, str, str]
+    arrived: float
+    merged: float
+    detected: float
+    displayed: float
+
+    @property
+    def total(self) -> float:
+        return self.displayed - self.arrived
+
+    def stages(self) -> Dict[str, float]:
+        """ Returns: The seconds spent in every stage of the pipeline. """
+        return {"read": self.merged - self.arrived, "analysis": self.detected - self.merged,
+                "display": self.displayed - self.detected}
+
+
+class LatencyRecorder:
+    """ Keeps the latency of the latest claims, for the diagnostics of the GUI.
+    The arrival of a claim is the last write of its source, so for a local pgn that
+    is only rewritten now and then it includes the time the pgn waited for the scan.
+
+    Attributes:
+        latencies: The latest claims and their timestamps, oldest first.
+    """
+    MAX_CLAIMS = 1000
+    __slots__ = ["latencies"]
+
+    def __init__(self):
+        self.latencies: Deque[ClaimLatency] = deque(maxlen=self.MAX_CLAIMS)
+
+    def record(self, entries: list, times: Optional[PassTimes], displayed: float) -> None:
+        """ Records the latency of a batch of claims.
+        Args:
+            entries: The claims (claim type, board number, players, move, game key).
+            times: The timestamps of the pass the claims were found in, None if they are unknown.
+            displayed: The time the claims were added to the table.
+        """
+        if times is None:
+            return
+        for entry in entries:
+            claim_type, board_number, players, move, game_key = entry
+            arrived = min(times.arrived.get(game_key.source, times.merged), times.merged)
+            self.latencies.append(ClaimLatency((claim_type.value, board_number, players, move), arrived,
+                                               times.merged, times.detected, displayed))
+
+    def histogram(self) -> List[Tuple[str, int]]:
+        """ Returns: The label and the number of claims of every bucket of the latency. """
+        counts = [0] * (len(BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[sum(latency.total > bound for bound in BUCKETS)] += 1
+
+        labels = [f"< {bound} s" for bound in BUCKETS] + [f">= {BUCKETS[-1]} s"]
+        return list(zip(labels, counts))
+
+    def breakdown(self) -> Dict[str, Tuple[float, float]]:
+        """ Returns: The median and the 95th percentile (in seconds) of every stage and of the total. """
+        stages: Dict[str, List[float]] = {}
+        for latency in self.latencies:
+            for stage, seconds in (*latency.stages().items(), ("total", latency.total)):
+                stages.setdefault(stage, []).append(seconds)
+        return {stage: (percentile(values, 0.5), percentile(values, 0.95)) for stage, values in stages.items()}
+
+    def export(self, path: str) -> None:
+        """ Writes the latency of every claim to a csv file. """
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["type", "board", "players", "move", "arrived", "merged", "detected", "displayed",
+                             "read", "analysis", "display", "total"])
+            for latency in self.latencies:
+                timestamps = [datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds")
+                              for timestamp in latency[1:]]
+                seconds = [f"{value:.3f}" for value in (*latency.stages().values(), latency.total)]
+                writer.writerow([*latency.claim, *timestamps, *seconds])
+
+    def clear(self) -> None:
+        self.latencies.clear()
+
+
+def percentile(values: List[float], share: float) -> float:
+    """ Returns: The value below which the given share of the values falls (nearest rank). """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
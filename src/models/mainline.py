@@ -0,0 +1,91 @@
+"""
+Chess Claim Tool: mainline
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from typing import List, Optional, TextIO
+
+from chess import Board, Move
+from chess.pgn import SKIP, BaseVisitor, Headers, read_game
+
+
+class MainlineGame:
+    """ A game as the claims need it: its headers and its mainline moves. It has the
+    part of the interface of chess.pgn.Game that Claims uses.
+
+    Attributes:
+        headers: The headers of the game.
+        moves: The mainline moves of the game.
+    """
+    __slots__ = ["headers", "moves"]
+
+    def __init__(self, headers: Headers, moves: List[Move]):
+        self.headers = headers
+        self.moves = moves
+
+    def board(self) -> Board:
+        """ Returns: The starting position of the game. """
+        return self.headers.board()
+
+    def mainline_moves(self) -> List[Move]:
+        return self.moves
+
+
+class MainlineVisitor(BaseVisitor[Optional[MainlineGame]]):
+    """ Reads the headers and the mainline moves of a game without building its GameNode
+    tree. The variations are skipped without parsing their moves, and the comments
+    (e.g. the [%clk] of every move of a broadcast) and the NAGs are dropped.
+    A game is read up to its first illegal move, like read_game does for its mainline.
+
+    Attributes:
+        headers: The headers of the game.
+        moves: The mainline moves read so far.
+    """
+    __slots__ = ["headers", "moves"]
+
+    def begin_game(self) -> None:
+        self.headers = Headers()
+        self.moves: List[Move] = []
+
+    def begin_headers(self) -> Headers:
+        return self.headers
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return SKIP
+
+    def visit_move(self, board: Board, move: Move) -> None:
+        self.moves.append(move)
+
+    def visit_result(self, result: str) -> None:
+        if self.headers.get("Result", "*") == "*":
+            self.headers["Result"] = result
+
+    def handle_error(self, error: Exception) -> None:
+        """ The rest of the moves after an illegal move are skipped by read_game. """
+
+    def result(self) -> Optional[MainlineGame]:
+        return MainlineGame(self.headers, self.moves)
+
+
+def read_mainline(handle: TextIO) -> Optional[MainlineGame]:
+    """ Returns: The next game of the pgn, None if the end of the pgn is reached.
+    Args:
+        handle: The pgn, as for read_game.
+    """
+    return read_game(handle, Visitor=MainlineVisitor)
@@ -0,0 +1,190 @@
+"""
+Chess Claim Tool: metrics
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable, Dict, Tuple
+
+# The type and the help of every metric, in the order they are served.
+DEFINITIONS = {
+    "chessclaim_download_bytes_total": ("counter", "The body bytes received from the web sources."),
+    "chessclaim_http_responses_total": ("counter", "The responses of the web sources, by status code."),
+    "chessclaim_games_read_total": ("counter", "The new or changed games read from the sources."),
+    "chessclaim_games_parsed_total": ("counter", "The games whose moves were parsed."),
+    "chessclaim_plies_analysed_total": ("counter", "The moves (half-moves) checked for claims."),
+    "chessclaim_claims_total": ("counter", "The claims found, by claim type."),
+    "chessclaim_cycles_total": ("counter", "The cycles of every worker."),
+    "chessclaim_cycle_seconds": ("gauge", "The duration of the last cycle of every worker."),
+    "chessclaim_lock_wait_seconds_total": ("counter", "The time every worker waited for the lock of the pgns."),
+    "chessclaim_scan_queue_games": ("gauge", "The changed games of the running pass of the scan."),
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Metrics:
+    """ The counters and the gauges published by the workers. An update is a dict
+    update under a lock, so the workers can publish from their hot loops.
+
+    Attributes:
+        values: The value of every metric, by name and labels.
+        lock: Guards the values, the workers update them from their own threads.
+    """
+    __slots__ = ["values", "lock"]
+
+    def __init__(self):
+        self.values: Dict[Key, float] = {}
+        self.lock = Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """ Increases a counter.
+        Args:
+            name: The name of the counter.
+            value: The increase.
+            labels: The labels of the counter (e.g. status="200").
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """ Sets a gauge.
+        Args:
+            name: The name of the gauge.
+            value: The new value.
+            labels: The labels of the gauge (e.g. worker="scan").
+        """
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def acquire(self, lock: Lock, worker: str) -> None:
+        """ Acquires a lock and publishes the time the worker waited for it. """
+        start = perf_counter()
+        lock.acquire()
+        self.inc("chessclaim_lock_wait_seconds_total", perf_counter() - start, worker=worker)
+
+    def timed(self, worker: str) -> Callable:
+        """ Returns: A decorator that publishes the number and the duration of the cycles of a worker. """
+        def decorator(cycle: Callable) -> Callable:
+            @wraps(cycle)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return cycle(*args, **kwargs)
+                finally:
+                    self.set("chessclaim_cycle_seconds", perf_counter() - start, worker=worker)
+                    self.inc("chessclaim_cycles_total", worker=worker)
+            return wrapper
+        return decorator
+
+    def take(self) -> Dict[Key, float]:
+        """ Returns: The metrics, which are reset, e.g. to send the counters of a worker process. """
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def add(self, values: Dict[Key, float]) -> None:
+        """ Adds the counters taken from another registry (e.g. of a worker process). """
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def to_prometheus(self) -> str:
+        """ Returns: The metrics in the Prometheus text format. """
+        with self.lock:
+            values = sorted(self.values.items())
+
+        lines = []
+        for name, (metric_type, description) in DEFINITIONS.items():
+            samples = [(labels, value) for (sample_name, labels), value in values if sample_name == name]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                text = ",".join(f'{label}="{escape(label_value)}"' for label, label_value in labels)
+                lines.append(f"{name}{{{text}}} {value:g}" if text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> str:
+        """ Returns: The metrics as JSON, a list of samples for every metric. """
+        with self.lock:
+            values = sorted(self.values.items())
+
+        metrics: Dict[str, list] = {}
+        for (name, labels), value in values:
+            metrics.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return json.dumps(metrics)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsServer(Thread):
+    """ Serves the metrics on localhost, for a local scraper:
+        - /metrics: The Prometheus text format.
+        - /metrics.json: JSON.
+    The metrics are rendered on every request, the workers do not wait for the server.
+
+    Attributes:
+        server: The HTTP server, bound to the port on creation (OSError if the port is in use).
+    """
+    DEFAULT_PORT = 9477
+    __slots__ = ["server"]
+
+    def __init__(self, port: int = DEFAULT_PORT, metrics: Metrics = None):
+        super().__init__()
+        self.daemon = True
+        metrics = metrics or METRICS
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = metrics.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+    def run(self) -> None:
+        self.server.serve_forever()
+
+    def stop(self) -> None:
+        if self.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
+
+
+# The metrics of all the workers, served by the MetricsServer.
+METRICS = Metrics()
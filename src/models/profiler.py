@@ -0,0 +1,146 @@
+"""
+Chess Claim Tool: profiler
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import cProfile
+import os
+import pstats
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Profiles(NamedTuple):
+    """ The result of a profiling session.
+    Attributes:
+        paths: The paths of the saved pstats files.
+        skipped: The number of cycles that could not be profiled, by name.
+    """
+    paths: List[str]
+    skipped: Dict[str, int]
+
+
+class ProfileData:
+    """ The stats of a profile (e.g. taken in another process), in the form pstats loads them. """
+    __slots__ = ["stats"]
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+def profile_call(function: Callable[..., T], *args) -> Tuple[T, Optional[dict]]:
+    """ Returns: The result of the call and its profile stats, None if another profiler was active
+    (only one at a time since Python 3.12), then the call is not profiled.
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return function(*args), None
+    try:
+        result = function(*args)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, profile.stats
+
+
+class CycleProfiler:
+    """ Profiles the cycles of the workers (a pass of the scan, the download
+    of a source) with cProfile while it is enabled. The cycles of the same name are added
+    together and saved as one pstats file, e.g. for `python -m pstats` or snakeviz.
+    While it is disabled a cycle costs only the check of the flag.
+    The cycles run in the thread (or the process) that does their work: every download
+    in its own thread, and with more than one analysis worker the analysis of every shard
+    in its worker process, whose stats are added here (see add).
+
+    Attributes:
+        enabled: True if the cycles are profiled.
+        stats: The stats of the cycles profiled since the profiler was enabled, by name.
+        skipped: The number of cycles that could not be profiled since the profiler was enabled, by name.
+        lock: Guards the stats, the workers run their cycles in their own threads.
+    """
+    __slots__ = ["enabled", "stats", "skipped", "lock"]
+
+    def __init__(self):
+        self.enabled = False
+        self.stats: Dict[str, pstats.Stats] = {}
+        self.skipped: Dict[str, int] = {}
+        self.lock = Lock()
+
+    def run(self, name: str, function: Callable[..., T], *args) -> T:
+        """ Runs a cycle, profiled if the profiler is enabled.
+        Args:
+            name: The name of the cycle (e.g. "scan").
+            function: The cycle.
+            args: The arguments of the cycle.
+        Returns:
+            The result of the cycle.
+        """
+        if not self.enabled:
+            return function(*args)
+
+        result, stats = profile_call(function, *args)
+        self.add(name, stats)
+        return result
+
+    def add(self, name: str, stats: Optional[dict]) -> None:
+        """ Adds the stats of a cycle (e.g. from a worker process), None if the cycle was not profiled. """
+        with self.lock:
+            if stats is None:
+                self.skipped[name] = self.skipped.get(name, 0) + 1
+            elif name in self.stats:
+                self.stats[name].add(ProfileData(stats))
+            else:
+                self.stats[name] = pstats.Stats(ProfileData(stats))
+
+    def start(self) -> None:
+        with self.lock:
+            self.stats = {}
+            self.skipped = {}
+        self.enabled = True
+
+    def stop(self, directory: str) -> Profiles:
+        """ Stops profiling and saves the stats of every cycle.
+        Args:
+            directory: The directory of the pstats files.
+        Returns:
+            The paths of the pstats files and the cycles that were not profiled.
+        """
+        self.enabled = False
+        with self.lock:
+            stats, self.stats = self.stats, {}
+            skipped, self.skipped = self.skipped, {}
+        if not stats:
+            return Profiles([], skipped)
+
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        paths = []
+        for name, cycle_stats in stats.items():
+            paths.append(os.path.join(directory, f"{name}-{timestamp}.pstats"))
+            cycle_stats.dump_stats(paths[-1])
+        return Profiles(paths, skipped)
+
+
+# The profiler of all the workers, enabled from the Options menu or with `--profile` of the headless mode.
+PROFILER = CycleProfiler()
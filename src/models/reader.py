@@ -0,0 +1,164 @@
+"""
+Chess Claim Tool: reader
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import re
+from hashlib import blake2b
+from threading import Lock
+from typing import Dict, Iterator, List, NamedTuple, Set, Tuple
+
+from src.models.metrics import METRICS
+
+# A game starts with its tag section: either an [Event tag at the start of a line
+# or any tag after one or more blank lines (the end of the previous movetext).
+GAME_START = re.compile(rb"\r?\n(?:[ \t]*\r?\n)*(?=\[Event[ \t])|\r?\n(?:[ \t]*\r?\n)+(?=\[)")
+NON_SPACE = re.compile(rb"\S")
+
+
+class GameSpan(NamedTuple):
+    """ The location of a game in the pgn and a hash of its content. """
+    offset: int
+    length: int
+    digest: bytes
+
+
+def split_games(data: bytes) -> List[GameSpan]:
+    """ Splits the raw bytes of a pgn into games, without parsing them.
+    Args:
+        data: The content of the pgn file.
+    Returns:
+        The span of every game in the order they appear in the file.
+    """
+    spans = []
+    start = 0
+    # The games are hashed through a view of the pgn, so they are not copied.
+    with memoryview(data) as view:
+        for match in GAME_START.finditer(data):
+            if match.start() > start:
+                spans.append(make_span(view, start, match.start()))
+            start = match.end()
+
+        if NON_SPACE.search(data, start):
+            spans.append(make_span(view, start, len(data)))
+    return spans
+
+
+def make_span(view: memoryview, start: int, end: int) -> GameSpan:
+    return GameSpan(start, end - start, blake2b(view[start:end], digest_size=16).digest())
+
+
+def decode_game(raw_game: bytes) -> str:
+    """ Returns: The text of a raw game (or of a part of it), UTF-8 or else Latin-1 (e.g. an older export). """
+    try:
+        return raw_game.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw_game.decode("latin-1")
+
+
+class PgnIndex:
+    """ Remembers the games of a pgn from the previous pass, so only the games whose
+    content changed since then have to be parsed again. A game that grows in the
+    middle of the file changes its own hash but not the hash of the games after it.
+
+    Attributes:
+        digests: The content hashes of the games found in the previous pass.
+    """
+    __slots__ = ["digests"]
+
+    def __init__(self):
+        self.digests: Set[bytes] = set()
+
+    def update(self, data: bytes) -> List[bytes]:
+        """ Indexes the new content of the pgn.
+        Args:
+            data: The content of the pgn file.
+        Returns:
+            The raw bytes of the games that are new or changed since the previous pass.
+        """
+        spans = split_games(data)
+        changed = [data[span.offset:span.offset + span.length] for span in spans
+                   if span.digest not in self.digests]
+
+        self.digests = {span.digest for span in spans}
+        return changed
+
+    def clear(self) -> None:
+        self.digests.clear()
+
+
+class SourceReader:
+    """ A virtual concatenation of all the pgn sources. The sources are read one after
+    the other, without ever building a combined pgn of them. A source whose modification
+    time and size did not change since the previous pass is not read at all.
+
+    Attributes:
+        filepaths: The paths of the pgn sources (local files or downloaded pgns).
+        lock: The lock that guards the downloaded pgns while they are being written.
+        indexes: The PgnIndex of every source.
+        arrived: The time every source was last written, as of its last read.
+        stats: The modification time (ns) and the size of every source, as of its last read.
+    """
+    __slots__ = ["filepaths", "lock", "indexes", "arrived", "stats"]
+
+    def __init__(self, filepaths: List[str], lock: Lock = None):
+        self.filepaths = list(filepaths)
+        self.lock = lock
+        self.indexes: Dict[str, PgnIndex] = {filepath: PgnIndex() for filepath in self.filepaths}
+        self.arrived: Dict[str, float] = {}
+        self.stats: Dict[str, Tuple[int, int]] = {}
+
+    def read_changed(self) -> Iterator[Tuple[str, bytes]]:
+        """ Yields: The source and the raw bytes of every game that is new or changed
+        since the previous pass, in the order they appear in the sources.
+        """
+        for filepath in self.filepaths:
+            for raw_game in self.read_source(filepath):
+                yield filepath, raw_game
+
+    def read_source(self, filepath: str) -> List[bytes]:
+        """ Returns: The raw bytes of the games of the source that are new or changed since the previous pass. """
+        if self.lock:
+            METRICS.acquire(self.lock, "scan")
+        try:
+            # An unchanged source is not even opened, the open would wake up the FileWatcher of the scan.
+            stat = os.stat(filepath)
+            self.arrived[filepath] = stat.st_mtime
+            if self.stats.get(filepath) == (stat.st_mtime_ns, stat.st_size):
+                return []
+            with open(filepath, "rb") as pgn:
+                # The stat of the open file, in case the source changed since the first stat. A write
+                # after it changes the stat again, so it is read on the next pass.
+                stat = os.fstat(pgn.fileno())
+                data = pgn.read()
+            self.stats[filepath] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            self.stats.pop(filepath, None)
+            data = bytes()
+        except OSError:
+            # E.g. a sharing violation on Windows while another program writes the source. The previous
+            # index and stat are kept, so the source is read again on the next pass.
+            return []
+        finally:
+            if self.lock:
+                self.lock.release()
+        return self.indexes[filepath].update(data)
+
+    def clear(self) -> None:
+        self.stats.clear()
+        for index in self.indexes.values():
+            index.clear()
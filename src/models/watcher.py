@@ -0,0 +1,134 @@
+"""
+Chess Claim Tool: FileWatcher
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os.path
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+def normalize(filepath: str) -> str:
+    return os.path.normcase(os.path.abspath(filepath))
+
+
+class ChangeHandler(FileSystemEventHandler):
+    """ Forwards the file system events that change the watched files to the FileWatcher.
+    The opened events and the closed events without a write are ignored, otherwise the
+    reads of the stage itself would wake it up again and it would never wait.
+    """
+    # Only the listed events wake the watcher, so the events of a read ("opened", and "closed_no_write" in
+    # the versions of watchdog that report it) are ignored whatever the version. "closed" follows a write.
+    EVENT_TYPES = {"modified", "created", "moved", "deleted", "closed"}
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event) -> None:
+        if event.is_directory or event.event_type not in self.EVENT_TYPES:
+            return
+
+        paths = (event.src_path, getattr(event, "dest_path", ""))
+        if any(path and normalize(path) in self.watcher.filepaths for path in paths):
+            self.watcher.notify()
+
+
+class FileWatcher:
+    """ Wakes up a stage of the pipeline as soon as one of its input files changes.
+    The file system events are used when watchdog is installed, otherwise the
+    modification time and size of the files are polled every POLL_INTERVAL.
+    Rewrites that keep both the same are caught by the content hashes of the
+    stage itself (see PgnIndex), on the safety net pass of every stage interval.
+
+    Attributes:
+        filepaths: The files to watch.
+        changed: Set when one of the files changed since the last wait.
+        observer: The watchdog observer, if watchdog is installed.
+        poller: The polling thread, if watchdog is not installed.
+        stop_event: Stops the polling thread.
+    """
+    POLL_INTERVAL = 0.5
+    __slots__ = ["filepaths", "changed", "observer", "poller", "stop_event"]
+
+    def __init__(self, filepaths: List[str]):
+        self.filepaths = {normalize(filepath) for filepath in filepaths}
+        self.changed = Event()
+        self.observer = None
+        self.poller: Optional[Thread] = None
+        self.stop_event = Event()
+
+    def start(self) -> None:
+        if Observer is not None:
+            try:
+                self.observer = Observer()
+                handler = ChangeHandler(self)
+                for directory in {os.path.dirname(filepath) for filepath in self.filepaths}:
+                    if os.path.isdir(directory):
+                        self.observer.schedule(handler, directory, recursive=False)
+                self.observer.daemon = True
+                self.observer.start()
+                return
+            except OSError:
+                self.observer = None
+
+        self.poller = Thread(target=self.poll, daemon=True)
+        self.poller.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.observer:
+            self.observer.stop()
+        self.notify()
+
+    def notify(self) -> None:
+        """ Wakes up the waiting stage. """
+        self.changed.set()
+
+    def wait(self, timeout: float) -> bool:
+        """ Waits until one of the files changes, or until the timeout.
+        Returns:
+            True if a file changed (or the stage was woken up), False on timeout.
+        """
+        changed = self.changed.wait(timeout)
+        self.changed.clear()
+        return changed
+
+    def poll(self) -> None:
+        last_stats = self.get_stats()
+        while not self.stop_event.wait(self.POLL_INTERVAL):
+            stats = self.get_stats()
+            if stats != last_stats:
+                self.notify()
+            last_stats = stats
+
+    def get_stats(self) -> Dict[str, Tuple[int, int]]:
+        """ Returns: The modification time and size of every watched file. """
+        stats = {}
+        for filepath in self.filepaths:
+            try:
+                stat = os.stat(filepath)
+                stats[filepath] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stats[filepath] = (0, 0)
+        return stats
@@ -18,25 +18,33 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 from __future__ import annotations
 
-import os.path
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from threading import Thread
-from typing import List, TYPE_CHECKING, Dict
+from time import time
+from typing import Callable, List, TYPE_CHECKING, Dict, Optional, Tuple, Union
 
-from PyQt5.QtCore import QRunnable, QThread, pyqtSignal
-from chess.pgn import read_game
 from src.helpers import get_appdata_path, Status
-from src.models.claims import get_players
-from src.models.download import check_download, download_pgn
+from src.models.analysis import ProcessAnalysis, SerialAnalysis, make_analysis
+from src.models.download import ConnectionPool, PgnDownload
+from src.models.latency import PassTimes
+from src.models.metrics import METRICS
+from src.models.profiler import PROFILER
+from src.models.reader import SourceReader
+from src.models.watcher import FileWatcher
 
 if TYPE_CHECKING:
     from src.controllers import SourceDialogController
     from src.views.dialog_view import SourceHBox
     from src.models.claims import Claims
     from threading import Event, Lock
-    from PyQt5.QtWidgets import QAction
 
 
-class CheckDownload(QRunnable):
+def ignore(*args) -> None:
+    """ The default callback of the workers. """
+
+
+class CheckDownload:
     """ Checks if a web source is valid.
     Attributes:
         controller: Object of SourceDialogController.
@@ -46,14 +54,13 @@ class CheckDownload(QRunnable):
     __slots__ = ["controller", "source", "download_id"]
 
     def __init__(self, controller: SourceDialogController, source: SourceHBox, download_id: int):
-        super().__init__()
         self.controller = controller
         self.source = source
         self.download_id = download_id
 
     def run(self):
         url = self.source.get_value()
-        if check_download(url):
+        if self.controller.check_url(url):
             self.source.set_status(Status.OK)
             if url not in self.controller.downloads:
                 self.controller.add_valid_url(url, self.download_id)
@@ -61,203 +68,216 @@ class CheckDownload(QRunnable):
             self.source.set_status(Status.ERROR)
 
 
-class DownloadGames(QThread):
-    """ Downloads a list of sources from the web.
+class DownloadGames(Thread):
+    """ Downloads a list of sources from the web. The sources are downloaded concurrently
+    over kept alive connections, so a cycle takes as long as the slowest source.
+    A local pgn is only rewritten when its source changed, and only the appended part is
+    written when the source grew.
 
     Attributes:
         downloads: The list of urls to download.
         stop_event: A stop signal that is emitted to stop this thread execution
+        lock: The lock that guards the downloaded pgns while they are being written.
+        pool: The kept alive connections to the web sources.
+        sources: The conditional download state of every url.
+        on_status: Called with the Status of every download cycle.
+        on_traffic: Called with the bytes received and saved so far, after every download cycle.
     """
-    status_signal = pyqtSignal(Status)
     INTERVAL = 4
-    __slots__ = ["downloads", "stop_event", "app_path"]
+    MAX_CONCURRENT = 8
+    SOURCE_TIMEOUT = 10
+    __slots__ = ["downloads", "stop_event", "app_path", "lock", "pool", "sources", "on_status", "on_traffic"]
 
-    def __init__(self, downloads: Dict[str, str], stop_event: Event = None):
+    def __init__(self, downloads: Dict[str, str], stop_event: Event = None, lock: Lock = None,
+                 on_status: Callable[[Status], None] = ignore, on_traffic: Callable[[int, int], None] = ignore):
         super().__init__()
+        self.daemon = True
         self.downloads = downloads
         self.stop_event = stop_event
         self.app_path = get_appdata_path()
+        self.lock = lock
+        self.pool = ConnectionPool()
+        self.sources = {url: PgnDownload(url) for url in downloads}
+        self.on_status = on_status
+        self.on_traffic = on_traffic
 
     def run(self) -> None:
-        if not self.stop_event:
-            return self.download_pgns()
-
-        while not self.stop_event.is_set():
-            self.download_pgns()
-            self.stop_event.wait(self.INTERVAL)
-
-    def download_pgns(self):
-        for url in self.downloads:
-            status = Status.OK
-
-            data = download_pgn(url)
-            if not data:
-                status = Status.ERROR
-            self.status_signal.emit(status)
-
-            filename = self.downloads[url]
+        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
             try:
-                with open(filename, "wb") as file:
-                    file.write(data)
-            except (FileNotFoundError, TypeError):
-                self.status_signal.emit(Status.ERROR)
-                continue
+                if not self.stop_event:
+                    return self.download_pgns(executor)
+
+                while not self.stop_event.is_set():
+                    self.download_pgns(executor)
+                    self.stop_event.wait(self.INTERVAL)
+            finally:
+                self.pool.close()
+
+    @METRICS.timed("download")
+    def download_pgns(self, executor: ThreadPoolExecutor):
+        # Every download is profiled in its own thread, this thread only waits for them.
+        results = list(executor.map(partial(PROFILER.run, "download", self.download_source),
+                                    list(self.downloads.items())))
+        self.on_status(Status.OK if all(results) else Status.ERROR)
+
+        received = sum(source.received for source in self.sources.values())
+        saved = sum(source.saved for source in self.sources.values())
+        self.on_traffic(received, saved)
+
+    def download_source(self, download: Tuple[str, str]) -> bool:
+        """ Downloads a source and writes it to its local file.
+        Args:
+            download: The url of the source and the path of its local file.
+        Returns:
+            True if successful, False otherwise.
+        """
+        url, filename = download
+        if url not in self.sources:
+            self.sources[url] = PgnDownload(url)
+
+        source = self.sources[url]
+        result = source.fetch(self.pool, self.SOURCE_TIMEOUT)
+        if not result.ok or result.data is None:
+            return result.ok
 
-
-class Scan(QThread):
-    """ Continuously looks for a new games.pgn to scan. It creates another thread
-    to check the new pgn while it updates the GUI(claimsTable) with new entries.
+        if self.lock:
+            METRICS.acquire(self.lock, "download")
+        try:
+            with open(filename, "ab" if result.append else "wb") as file:
+                file.write(result.data)
+        except OSError:
+            # The local file may miss (a part of) the new content, the next download rewrites it in full.
+            source.reset()
+            return False
+        finally:
+            if self.lock:
+                self.lock.release()
+        source.commit()
+        return True
+
+
+class Scan(Thread):
+    """ Continuously looks for updated pgn sources to scan, while it delivers the new
+    entries to its caller (e.g. the claimsTable of the GUI). The sources are read directly
+    through a SourceReader and only the games that changed since the previous pass are
+    parsed and checked, either in this thread or on a pool of worker processes.
+    A pass starts as soon as a source changes, and at least every INTERVAL seconds.
+    If the stop event is not provided the thread will only execute one pass.
 
     Attributes:
-        filename: The path of the combined pgn file.
+        reader: The SourceReader over all the pgn sources.
+        watcher: The FileWatcher of the pgn sources.
         claims: An Object of Claims Class.
-        lock: The fileLock for the games.pgn between CheckPgn and MakePgn threads.
-        live_pgn_option: The checkbox object on the menu.
+        is_live_only: Returns True if only the live games should be checked (e.g. the Live PGN option).
         stop_event: A stop signal that is emitted to stop this thread execution
+        workers: The number of processes that check the games.
+        live_only: The state of the live option in the previous pass.
+        on_entries: Called with the new entries of every pass and the PassTimes of the pass.
+        on_status: Called with the Status of the scan.
     """
-    __slots__ = ["filename", "claims", "lock", "live_pgn_option", "stop_event"]
+    __slots__ = ["reader", "watcher", "claims", "is_live_only", "stop_event", "workers", "live_only",
+                 "on_entries", "on_status"]
 
-    add_entry_signal = pyqtSignal(tuple)
-    status_signal = pyqtSignal(Status)
     INTERVAL = 4
 
-    def __init__(self, claims: Claims, filename: str, lock: Lock, live_pgn_option: QAction, stop_event: Event):
+    def __init__(self, claims: Claims, filepaths: List[str], lock: Optional[Lock], is_live_only: Callable[[], bool],
+                 stop_event: Optional[Event], workers: int = 1,
+                 on_entries: Callable[[list, PassTimes], None] = ignore, on_status: Callable[[Status], None] = ignore):
         super().__init__()
-        self.filename = filename
+        self.daemon = True
+        self.reader = SourceReader(filepaths, lock)
+        self.watcher = FileWatcher(filepaths)
         self.claims = claims
-        self.lock = lock
-        self.live_pgn_option = live_pgn_option
+        self.is_live_only = is_live_only
         self.stop_event = stop_event
+        self.workers = workers
+        self.live_only = False
+        self.on_entries = on_entries
+        self.on_status = on_status
 
     def run(self):
-        last_size = 0
-
-        while not self.stop_event.is_set():
+        analysis = make_analysis(self.claims, self.workers)
+        if not self.stop_event:
             try:
-                size_of_pgn = os.path.getsize(self.filename)
-            except FileNotFoundError:
-                size_of_pgn = 0
-
-            if self.is_file_updated(last_size, size_of_pgn):
-                self.status_signal.emit(Status.ACTIVE)
-                self.check_pgn()
-
-            self.status_signal.emit(Status.WAIT)
-            last_size = size_of_pgn
-
-            self.stop_event.wait(self.INTERVAL)
-
-    def check_pgn(self):
-        self.lock.acquire()
-
-        with open(self.filename) as pgn:
+                analysis.start()
+                return PROFILER.run("scan", self.check_pgn, analysis)
+            finally:
+                analysis.shutdown()
+
+        self.watcher.start()
+        try:
+            analysis.start()
+            changed = True
             while not self.stop_event.is_set():
-                game = read_game(pgn)
-
-                if not game:
-                    break
-
-                if self.live_pgn_option.isChecked() and game.headers["Result"] != "*":
-                    continue
-
-                if get_players(game) in self.claims.dont_check:
-                    continue
-
-                entries = self.claims.check_game(game)
-                for entry in entries:
-                    self.add_entry_signal.emit(entry)
-
-        self.lock.release()
-
-    @staticmethod
-    def is_file_updated(last_size: int, current_size: int):
-        return current_size != 0 and last_size != current_size
-
-
-class Stop(QThread):
-    """ Stops all the other running Threads(downloadWorker, makePgnWorker,scanWorker)
+                # The pass after a timeout is the safety net, the unchanged games cost only their hash.
+                if changed:
+                    self.on_status(Status.ACTIVE)
+                PROFILER.run("scan", self.check_pgn, analysis)
+
+                self.on_status(Status.WAIT)
+                changed = self.watcher.wait(self.INTERVAL)
+        finally:
+            self.watcher.stop()
+            analysis.shutdown()
+
+    def wake(self) -> None:
+        """ Wakes up the thread, e.g. to notice the stop event without waiting for the interval. """
+        self.watcher.notify()
+
+    @METRICS.timed("scan")
+    def check_pgn(self, analysis: Union[SerialAnalysis, ProcessAnalysis]):
+        # The games skipped by the live option have to be checked again once it is unchecked.
+        live_only = self.is_live_only()
+        if live_only != self.live_only:
+            self.reader.clear()
+            self.live_only = live_only
+
+        raw_games = list(self.reader.read_changed())
+        if not raw_games or (self.stop_event and self.stop_event.is_set()):
+            return
+        merged = time()
+        METRICS.inc("chessclaim_games_read_total", len(raw_games))
+        METRICS.set("chessclaim_scan_queue_games", len(raw_games))
+
+        # The entries of a pass are delivered as one batch, with the timestamps of the pass.
+        entries = analysis.analyse(raw_games, live_only)
+        METRICS.set("chessclaim_scan_queue_games", 0)
+        for entry in entries:
+            METRICS.inc("chessclaim_claims_total", type=entry[0].value)
+        if entries:
+            self.on_entries(entries, PassTimes(dict(self.reader.arrived), merged, time()))
+
+
+class Stop(Thread):
+    """ Stops all the other running Threads(downloadWorker, scanWorker)
     and resets the model for the next scan.
 
     Attributes:
         stop_event: The stop event that can signal the termination of threads
         download_worker: Running thread, object of Download Class.
-        make_pgn_worker: Running thread, object of makePgn Class.
         scan_worker: Running thread, object of Scan Class.
+        on_disable: Called before the threads are stopped.
+        on_enable: Called after the threads are stopped.
     """
-    enable_signal = pyqtSignal()
-    disable_signal = pyqtSignal()
-
-    __slots__ = ["stop_event", "make_pgn_worker", "scan_worker", "download_worker"]
+    __slots__ = ["stop_event", "scan_worker", "download_worker", "on_disable", "on_enable"]
 
-    def __init__(self, stop_event: Event, make_pgn_worker: Thread, scan_worker: QThread,
-                 download_worker: QThread = None):
+    def __init__(self, stop_event: Event, scan_worker: Scan, download_worker: DownloadGames = None,
+                 on_disable: Callable[[], None] = ignore, on_enable: Callable[[], None] = ignore):
         super().__init__()
         self.stop_event = stop_event
         self.download_worker = download_worker
-        self.make_pgn_worker = make_pgn_worker
         self.scan_worker = scan_worker
+        self.on_disable = on_disable
+        self.on_enable = on_enable
 
     def run(self):
-        self.disable_signal.emit()
+        self.on_disable()
         self.stop_event.set()
 
         if self.download_worker:
-            self.download_worker.wait()
-        self.scan_worker.wait()
-        self.make_pgn_worker.join()
-
-        self.enable_signal.emit()
-
-
-class MakePgn(Thread):
-    """ Makes a combined pgn of all the sources available (using the filePathList).
-    The thread execution can be stopped by "setting" the event (`stop_event.set()`).
-    If the event is not provided the thread will only execute once.
-
-    Attributes:
-        filepaths: A list that contains all the files path(or url) which are valid.
-        stop_event: The event that is responsible for the execution of the thread.
-        lock: The fileLock for the games.pgn between CheckPgn and MakePgn threads.
-    """
-    INTERVAL = 4
-    __slots__ = ["filepaths", "stop_event", "is_running", "lock", "daemon"]
-
-    def __init__(self, filepaths: List[str], stop_event: Event = None, lock: Lock = None):
-        super().__init__()
-        self.filepaths = filepaths
-        self.lock = lock
-        self.stop_event = stop_event
-        self.daemon = True
-
-        app_path = get_appdata_path()
-        self.filename = os.path.join(app_path, "games.pgn")
-
-    def run(self) -> None:
-        if not self.stop_event:
-            return self.make_pgn()
+            self.download_worker.join()
+        self.scan_worker.wake()
+        self.scan_worker.join()
 
-        while not self.stop_event.is_set():
-            self.make_pgn()
-            self.stop_event.wait(self.INTERVAL)
+        self.on_enable()
 
-    def make_pgn(self):
-        data = bytes()
-        for filepath in self.filepaths:
-            try:
-                with open(filepath, "rb") as in_file:
-                    data += "\n\n".encode("utf-8") + in_file.read()
-            except FileNotFoundError:
-                continue
-
-        self.lock_file()
-        with open(self.filename, "wb") as file:
-            file.write(data)
-        self.release_file()
-
-    def lock_file(self):
-        if self.lock:
-            self.lock.acquire()
-
-    def release_file(self):
-        if self.lock:
-            self.lock.release()
@@ -0,0 +1,151 @@
+"""
+Chess Claim Tool: NotificationDispatcher
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import platform
+from threading import Condition, Thread
+from time import monotonic
+from typing import Callable, Dict, List, Optional
+
+from src.helpers import ClaimType
+
+URGENT = (ClaimType.FIVEFOLD, ClaimType.SEVENTYFIVE_MOVES)
+
+
+def load_notification() -> Optional[type]:
+    """ Returns: The Notification class of the OS, None if the OS is not supported. """
+    if platform.system() == "Darwin":
+        from src.notifications.mac import Notification
+        return Notification
+    if platform.system() == "Windows":
+        from src.notifications.windows import Notification
+        return Notification
+    return None
+
+
+def get_notification():
+    """ Returns: The notification system of the OS, None if the OS is not supported. """
+    notification_type = load_notification()
+    return notification_type() if notification_type else None
+
+
+class NotificationDispatcher(Thread):
+    """ Decides on a background thread which notifications of the claims are sent, so
+    the GUI never waits for them. The pending claims are deduplicated per game (only the
+    latest claim of a game is kept) and the notifications are rate limited: the claims
+    that arrive within the interval are merged into one summary. The 5 Fold Repetitions
+    and the 75 Moves Rules are not held back by the rate limit and are listed first,
+    since the arbiter should intervene.
+
+    The notifications are delivered by the deliver callback, which the GUI queues to its
+    main thread: the notification APIs of the OS (e.g. NSUserNotificationCenter) are not
+    thread-safe. The module of the notification system is imported by the thread, so
+    its (slow) import does not delay the startup of the GUI.
+
+    Attributes:
+        deliver: Shows a notification (title, subtitle, text), called from the thread.
+        load_notification: Imports the notification system of the OS, None if the OS is not supported.
+        supported: True if the OS has a notification system, once it is loaded.
+        loaded: True once the notification system of the OS is loaded.
+        interval: The minimum time in seconds between two notifications.
+        pending: The claims waiting to be notified, keyed by the GameKey of the game.
+        condition: Guards the pending claims and wakes up the thread.
+        last_sent: The time the last notification was sent.
+    """
+    INTERVAL = 5
+    SUMMARY_LINES = 3
+    __slots__ = ["deliver", "load_notification", "supported", "loaded", "interval", "pending", "condition",
+                 "last_sent"]
+
+    def __init__(self, deliver: Callable[[str, str, str], None],
+                 load_notification: Callable[[], Optional[type]] = load_notification, interval: float = INTERVAL):
+        super().__init__()
+        self.daemon = True
+        self.deliver = deliver
+        self.load_notification = load_notification
+        self.supported = False
+        self.loaded = False
+        self.interval = interval
+        self.pending: Dict[tuple, tuple] = {}
+        self.condition = Condition()
+        self.last_sent = float("-inf")
+
+    def post(self, entries: List[tuple]) -> None:
+        """ Queues the claims to be notified, it never blocks.
+        Args:
+            entries: The claims (claim type, board number, players, move, game key).
+        """
+        if self.loaded and not self.supported:
+            return
+
+        with self.condition:
+            for entry in entries:
+                previous = self.pending.get(entry[4])
+                if previous is None or previous[0] not in URGENT or entry[0] in URGENT:
+                    self.pending[entry[4]] = entry
+            self.condition.notify()
+
+    def run(self) -> None:
+        self.supported = self.load_notification() is not None
+        self.loaded = True
+        if not self.supported:
+            with self.condition:
+                self.pending.clear()
+            return
+
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+
+                # Wait for the rate limit, unless an intervention is needed.
+                while not self.has_urgent() and monotonic() < self.last_sent + self.interval:
+                    self.condition.wait(self.last_sent + self.interval - monotonic())
+
+                entries = list(self.pending.values())
+                self.pending.clear()
+                self.last_sent = monotonic()
+
+            self.send(entries)
+
+    def has_urgent(self) -> bool:
+        return any(entry[0] in URGENT for entry in self.pending.values())
+
+    def send(self, entries: List[tuple]) -> None:
+        if len(entries) == 1:
+            claim_type, _, players, move = entries[0][:4]
+            title, subtitle, text = claim_type.value, players, move
+        else:
+            title, subtitle, text = self.get_summary(entries)
+
+        self.deliver(title, subtitle, text)
+
+    def get_summary(self, entries: List[tuple]):
+        """ Returns: The title, subtitle and text of one notification for many claims.
+        Args:
+            entries: The claims (claim type, board number, players, move, game key).
+        """
+        urgent = [entry for entry in entries if entry[0] in URGENT]
+        others = [entry for entry in entries if entry[0] not in URGENT]
+
+        lines = [f"{entry[0].value}: {entry[2]}" for entry in (urgent + others)[:self.SUMMARY_LINES]]
+        if len(entries) > self.SUMMARY_LINES:
+            lines.append(f"and {len(entries) - self.SUMMARY_LINES} more")
+
+        title = f"{len(entries)} New Claims"
+        subtitle = f"{len(urgent)} need intervention" if urgent else ""
+        return title, subtitle, "\n".join(lines)
@@ -0,0 +1,50 @@
+"""
+Chess Claim Tool: Notification (Windows)
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from windows_toasts import WindowsToaster, ToastImageAndText2, ToastDisplayImage, ToastDuration
+
+from src.helpers import resource_path
+
+
+class Notification:
+    """ The Notification System using the Windows Toasts.
+    Attributes:
+        toaster: The toaster that shows the notifications.
+    """
+
+    def __init__(self):
+        self.toaster = WindowsToaster("Chess Claim Tool")
+
+    def clearNotifications(self):
+        """ The previous toasts expire on their own. """
+        pass
+
+    def notify(self, title, subtitle, text):
+        """ Shows a toast.
+        Args:
+            title: The title of the notification.
+            subtitle: The subtitle of the notification.
+            text: The informative text of the notification.
+        """
+        toast = ToastImageAndText2()
+        toast.SetHeadline(title)
+        toast.SetBody(f"{subtitle} \n{text}" if subtitle else text)
+        toast.AddImage(ToastDisplayImage.fromPath(resource_path("logo.ico")))
+        toast.SetDuration(ToastDuration("short"))
+
+        self.toaster.show_toast(toast)
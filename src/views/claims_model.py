@@ -0,0 +1,197 @@
+"""
+Chess Claim Tool: ClaimsTableModel
+
+Copyright (C) 2022 Serntedakis Athanasios <thanserd@hotmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from typing import Any, Dict, List, Tuple
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtGui import QColor, QFont
+from src.helpers import ClaimType
+
+
+class ClaimRow:
+    """ A row of the Claims Table.
+    Attributes:
+        seq: The insertion order of the row, used to sort by the "#" column.
+        timestamp: The time the claim was added to the table.
+        claim_type: The type of the claim.
+        board_number: The board of the game.
+        players: The players of the game.
+        move: The move of the claim.
+        game_key: The GameKey of the game.
+    """
+    __slots__ = ["seq", "timestamp", "claim_type", "board_number", "players", "move", "game_key"]
+
+    def __init__(self, seq: int, timestamp: str, claim_type: ClaimType, board_number: str, players: str, move: str,
+                 game_key: tuple):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.claim_type = claim_type
+        self.board_number = board_number
+        self.players = players
+        self.move = move
+        self.game_key = game_key
+
+    def get_key(self) -> Tuple[tuple, str]:
+        return self.game_key, self.claim_type.family
+
+    def get_sort_key(self, column: int):
+        return self.seq if column == 0 else self.get_text(column)
+
+    def get_text(self, column: int) -> str:
+        if column == 1:
+            return self.timestamp
+        if column == 2:
+            return self.claim_type.value
+        if column == 3:
+            return self.board_number
+        if column == 4:
+            return self.players
+        return self.move
+
+
+class ClaimsTableModel(QAbstractTableModel):
+    """ The model of the Claims Table. Every game has at most one row per claim family
+    (repetitions, move rules), found through an index keyed by (game key, family), so a
+    new claim replaces the previous claim of its family in place. The "#" column is the
+    position of the row and it is not stored.
+
+    Attributes:
+        rows: The rows of the table, in the order they are displayed.
+        row_index: The position of the row of every (game key, family).
+        seq: The number of rows inserted so far.
+        bold_font: The font of the "Type" column.
+    """
+    LABELS = ["#", "Timestamp", "Type", "Board", "Players", "Move"]
+    RED = QColor(255, 0, 0)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rows: List[ClaimRow] = []
+        self.row_index: Dict[Tuple[tuple, str], int] = {}
+        self.seq = 0
+
+        self.bold_font = QFont()
+        self.bold_font.setBold(True)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.LABELS)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.LABELS[section]
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return str(index.row() + 1) if column == 0 else row.get_text(column)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        if role == Qt.FontRole and column == 2:
+            return self.bold_font
+        if (role == Qt.ForegroundRole and column == 2 and
+                row.claim_type in (ClaimType.FIVEFOLD, ClaimType.SEVENTYFIVE_MOVES)):
+            return self.RED
+        return None
+
+    def add_claims(self, timestamp: str, entries: List[tuple]) -> List[int]:
+        """ Adds a batch of claims to the table. If the game already has a claim of the same
+        family (e.g. a 3 Fold Repetition is followed by a 5 Fold Repetition) it is replaced
+        in place, otherwise the claim is appended. The replaced rows are updated per contiguous
+        run and the new rows are inserted as one range.
+        Args:
+            timestamp: The time the claims were added.
+            entries: The claims (claim type, board number, players, move, game key), in the order they occurred.
+        Returns:
+            The positions of the rows of the claims.
+        """
+        changed = set()
+        new_rows: List[ClaimRow] = []
+        new_index: Dict[Tuple[tuple, str], int] = {}
+
+        for entry in entries:
+            self.seq += 1
+            claim_row = ClaimRow(self.seq, timestamp, *entry)
+            key = claim_row.get_key()
+
+            if key in self.row_index:
+                position = self.row_index[key]
+                claim_row.seq = self.rows[position].seq
+                self.rows[position] = claim_row
+                changed.add(position)
+            elif key in new_index:
+                claim_row.seq = new_rows[new_index[key]].seq
+                new_rows[new_index[key]] = claim_row
+            else:
+                new_index[key] = len(new_rows)
+                new_rows.append(claim_row)
+
+        for first, last in get_runs(sorted(changed)):
+            self.dataChanged.emit(self.createIndex(first, 1), self.createIndex(last, len(self.LABELS) - 1))
+
+        if new_rows:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+            self.rows.extend(new_rows)
+            for key, offset in new_index.items():
+                self.row_index[key] = first + offset
+            self.endInsertRows()
+            changed.update(range(first, first + len(new_rows)))
+
+        return sorted(changed)
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.rows.clear()
+        self.row_index.clear()
+        self.seq = 0
+        self.endResetModel()
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.AscendingOrder) -> None:
+        self.layoutAboutToBeChanged.emit()
+        persistent_indexes = self.persistentIndexList()
+        persistent_keys = [self.rows[index.row()].get_key() for index in persistent_indexes]
+
+        self.rows.sort(key=lambda claim_row: claim_row.get_sort_key(column), reverse=order == Qt.DescendingOrder)
+        self.row_index = {claim_row.get_key(): position for position, claim_row in enumerate(self.rows)}
+
+        self.changePersistentIndexList(persistent_indexes,
+                                       [self.createIndex(self.row_index[key], index.column())
+                                        for key, index in zip(persistent_keys, persistent_indexes)])
+        self.layoutChanged.emit()
+
+
+def get_runs(positions: List[int]) -> List[Tuple[int, int]]:
+    """ Returns: The first and the last position of every run of consecutive positions.
+    Args:
+        positions: The positions, in ascending order.
+    """
+    runs = []
+    for position in positions:
+        if runs and runs[-1][1] == position - 1:
+            runs[-1] = (runs[-1][0], position)
+        else:
+            runs.append((position, position))
+    return runs
@@ -18,25 +18,24 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 from __future__ import annotations
 
-import platform
+import os
 from datetime import datetime
-from typing import Optional, Callable, TYPE_CHECKING
+from time import time
+from typing import Optional, Callable, List, TYPE_CHECKING
 
-from PyQt5.QtCore import Qt, QSize, QEvent
-from PyQt5.QtGui import QStandardItemModel, QPixmap, QMovie, QStandardItem, QColor
+from PyQt5.QtCore import Qt, QSize, QEvent, QObject, pyqtSignal
+from PyQt5.QtGui import QPixmap, QMovie
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QTreeView, QPushButton, QDesktopWidget,
                              QAbstractItemView, QHBoxLayout, QVBoxLayout, QLabel, QStatusBar, QMessageBox, QAction,
-                             QDialog)
+                             QDialog, QActionGroup, QGridLayout, QFileDialog)
 from src.helpers import resource_path, Status
-from src.models.claims import ClaimType
-
-if platform.system() == "Darwin":
-    from src.notifications.mac import Notification
-elif platform.system() == "Windows":
-    from windows_toasts import WindowsToaster, ToastImageAndText2, ToastDisplayImage, ToastDuration
+from src.models.latency import LatencyRecorder, PassTimes
+from src.notifications.dispatcher import NotificationDispatcher, get_notification
+from src.views.claims_model import ClaimsTableModel
 
 if TYPE_CHECKING:
     from src.controllers import ChessClaimController
+    from src.models.profiler import Profiles
 
 
 def sources_warning():
@@ -49,11 +48,35 @@ def sources_warning():
     warning_dialog.exec()
 
 
+class NotificationDelivery(QObject):
+    """ Shows the notifications of the NotificationDispatcher on the main thread, the
+    notification APIs of the OS are not thread-safe. The signal is emitted by the thread
+    of the dispatcher and queued to the thread of this object.
+
+    Attributes:
+        notification: The notification system of the OS, None until the first notification.
+    """
+    notify_signal = pyqtSignal(str, str, str)
+
+    def __init__(self):
+        super().__init__()
+        self.notification = None
+        self.notify_signal.connect(self.notify, Qt.QueuedConnection)
+
+    def notify(self, title: str, subtitle: str, text: str) -> None:
+        if self.notification is None:
+            self.notification = get_notification()
+        if self.notification:
+            self.notification.clearNotifications()
+            self.notification.notify(title, subtitle, text)
+
+
 class ChessClaimView(QMainWindow):
     ICON_SIZE = 16
     __slots__ = ["controller", "claims_table", "live_pgn_option", "claims_table_model", "button_box", "ok_pixmap",
                  "error_pixmap", "source_label", "source_image", "download_label", "download_image", "scan_label",
-                 "scan_image", "spinner", "status_bar", "about_dialog", "notification"]
+                 "scan_image", "spinner", "status_bar", "about_dialog", "notifier", "workers_group", "latency",
+                 "latency_label", "latency_dialog", "profile_option", "metrics_option", "delivery"]
 
     def __init__(self, controller: ChessClaimController) -> None:
         super().__init__()
@@ -65,7 +88,10 @@ class ChessClaimView(QMainWindow):
 
         self.claims_table = QTreeView()
         self.live_pgn_option = QAction('Live PGN', self)
-        self.claims_table_model = QStandardItemModel()
+        self.profile_option = QAction('Profile Scan', self)
+        self.metrics_option = QAction('Metrics Endpoint', self)
+        self.workers_group = QActionGroup(self)
+        self.claims_table_model = ClaimsTableModel()
         self.button_box = ButtonBox()
         self.ok_pixmap = QPixmap(resource_path("check_icon.png"))
         self.error_pixmap = QPixmap(resource_path("error_icon.png"))
@@ -78,11 +104,12 @@ class ChessClaimView(QMainWindow):
         self.spinner = QMovie(resource_path("spinner.gif"))
         self.status_bar = QStatusBar()
         self.about_dialog = AboutDialog()
-
-        if platform.system() == "Darwin":
-            self.notification = Notification()
-        elif platform.system() == "Windows":
-            self.notification = WindowsToaster("Chess Claim Tool")
+        self.latency = LatencyRecorder()
+        self.latency_label = QLabel()
+        self.latency_dialog = LatencyDialog(self.latency)
+        self.delivery = NotificationDelivery()
+        self.notifier = NotificationDispatcher(self.delivery.notify_signal.emit)
+        self.notifier.start()
 
     def center(self) -> None:
         """ Centers the window on the screen """
@@ -113,17 +140,49 @@ class ChessClaimView(QMainWindow):
 
     def create_menu(self) -> None:
         self.live_pgn_option.setCheckable(True)
+        self.profile_option.setCheckable(True)
+        self.profile_option.toggled.connect(self.controller.on_profile_toggled)
+        self.metrics_option.setCheckable(True)
+        self.metrics_option.toggled.connect(self.controller.on_metrics_toggled)
         about_action = QAction('About', self)
+        latency_action = QAction('Claim Latency', self)
 
         menu_bar = self.menuBar()
 
         options_menu = menu_bar.addMenu('&Options')
         options_menu.addAction(self.live_pgn_option)
 
+        workers_menu = options_menu.addMenu('Analysis Workers')
+        for workers in self.get_workers_choices():
+            workers_action = QAction(str(workers), self.workers_group)
+            workers_action.setCheckable(True)
+            workers_action.setData(workers)
+            workers_action.setChecked(workers == 1)
+            workers_menu.addAction(workers_action)
+        options_menu.addAction(self.profile_option)
+        options_menu.addAction(self.metrics_option)
+
         about_menu = menu_bar.addMenu('&Help')
+        about_menu.addAction(latency_action)
         about_menu.addAction(about_action)
+        latency_action.triggered.connect(self.controller.on_latency_clicked)
         about_action.triggered.connect(self.controller.on_about_clicked)
 
+    @staticmethod
+    def get_workers_choices() -> List[int]:
+        """ Returns: The choices for the number of analysis workers, 1 up to the number of cores. """
+        cores = os.cpu_count() or 1
+        choices = [1]
+        while choices[-1] * 2 < cores:
+            choices.append(choices[-1] * 2)
+        if cores > 1:
+            choices.append(cores)
+        return choices
+
+    def get_analysis_workers(self) -> int:
+        """ Returns: The number of processes that check the games, as selected on the menu. """
+        return self.workers_group.checkedAction().data()
+
     def create_claims_table(self) -> None:
         self.claims_table.setFocusPolicy(Qt.NoFocus)
         self.claims_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
@@ -132,9 +191,8 @@ class ChessClaimView(QMainWindow):
         self.claims_table.setIndentation(0)
         self.claims_table.setUniformRowHeights(True)
 
-        labels = ["#", "Timestamp", "Type", "Board", "Players", "Move"]
-        self.claims_table_model.setHorizontalHeaderLabels(labels)
         self.claims_table.setModel(self.claims_table_model)
+        self.resize_claims_table()
 
     def create_status_bar(self) -> None:
         sources_button = QPushButton("Add Sources")
@@ -155,132 +213,53 @@ class ChessClaimView(QMainWindow):
         self.status_bar.addWidget(self.download_image)
         self.status_bar.addWidget(self.scan_label)
         self.status_bar.addWidget(self.scan_image)
+        self.status_bar.addWidget(self.latency_label)
         self.status_bar.addPermanentWidget(sources_button)
         self.status_bar.setContentsMargins(10, 5, 9, 5)
 
     def resize_claims_table(self) -> None:
-        """ Resize the table (if needed) after the insertion of a new element. """
-        for index in range(0, 6):
+        """ Resize all the columns of the table to their contents. """
+        for index in range(self.claims_table_model.columnCount()):
             self.claims_table.resizeColumnToContents(index)
 
-    def add_item_to_table(self, entry: list) -> None:
-        """ Add new row to the claimsTable
+    def fit_claims_row(self, row: int) -> None:
+        """ Widen the columns (if needed) to fit a new or updated row, without measuring the other rows.
         Args:
-
+            row: The position of the row.
+        """
+        for column in range(self.claims_table_model.columnCount()):
+            index = self.claims_table_model.index(row, column)
+            width = self.claims_table.sizeHintForIndex(index).width()
+            if width > self.claims_table.columnWidth(column):
+                self.claims_table.setColumnWidth(column, width)
+
+    def add_items_to_table(self, entries: list, times: Optional[PassTimes] = None) -> None:
+        """ Add a batch of claims to the claimsTable. A claim replaces the row of its game
+        with the previous claim of the same family. The notifications are sent by the
+        NotificationDispatcher, so they never block the table updates.
+        Args:
+            entries: The claims (claim type, board number, players, move, game key).
+            times: The timestamps of the scan pass that found the claims, for their latency.
         """
-        claim_type, board_number, players, move = entry[:4]
-
-        self.remove_rows_by_claim_type(claim_type, players)
-
         timestamp = str(datetime.now().strftime('%H:%M:%S'))
-        row = []
-        count = str(self.claims_table_model.rowCount() + 1)
-        items = [count, timestamp, claim_type.value, board_number, players, move]
+        rows = self.claims_table_model.add_claims(timestamp, entries)
+        if not rows:
+            return
 
-        """ Convert each item(str) to QStandardItem, make the necessary stylistic
-        additions and append it to row."""
-        for idx, item in enumerate(items):
-            standard_item = self.create_standard_item(item, idx)
-            row.append(standard_item)
-
-        self.claims_table_model.appendRow(row)
-        self.resize_claims_table()
+        for row in rows:
+            self.fit_claims_row(row)
 
-        # Always the last row(the bottom of the table) should be visible.
-        self.claims_table.scrollToBottom()
-        self.notify(claim_type, players, move)
-
-    @staticmethod
-    def create_standard_item(item: str, idx: int) -> QStandardItem:
-        q_item = QStandardItem(item)
-        q_item.setTextAlignment(Qt.AlignCenter)
-
-        if idx == 2:
-            font = q_item.font()
-            font.setBold(True)
-            q_item.setFont(font)
-
-        if item == ClaimType.FIVEFOLD.value or item == ClaimType.SEVENTYFIVE_MOVES.value:
-            q_item.setData(QColor(255, 0, 0), Qt.ForegroundRole)
-
-        return q_item
-
-    def notify(self, claim_type: ClaimType, players: str, move: str) -> None:
-        """ Send notification depending on the OS.
-        Args:
-            claim_type: The type of the draw (3 Fold Repetition, 5 Fold Repetition,
-                                        50 Moves Rule, 75 Moves Rule).
-            players: The names of the players.
-            move: With which move the draw is valid.
-        """
-        if platform.system() == "Darwin":
-            self.notification.clearNotifications()
-            self.notification.notify(claim_type.value, players, move)
-        elif platform.system() == "Windows":
-            newToast = ToastImageAndText2()
-            newToast.SetHeadline(claim_type.value)
-            newToast.SetBody(f"{players} \n{move}")
-            newToast.AddImage(ToastDisplayImage.fromPath(resource_path("logo.ico")))
-            newToast.SetDuration(ToastDuration("short"))
-
-            self.notification.show_toast(newToast)
-
-    def remove_row_by_index(self, index: int) -> None:
-        """ Remove element from the claimsTable.
-        Args:
-            index: The index of the row we want to remove. First row has index=0.
-        """
-        self.claims_table_model.removeRow(index)
+        # Always the new claims should be visible.
+        self.claims_table.scrollTo(self.claims_table_model.index(rows[-1], 0))
 
-    def remove_rows_by_claim_type(self, claim_type: ClaimType, players: str) -> None:
-        """ Removes an existing row from the Claims Table when same players made
-        the same type of draw with a new move - or they made 5-Fold Repetition
-        over the 3-Fold or 75 Moves Rule over 50 moves Rule.
+        self.latency.record(entries, times, time())
+        self.set_latency_status()
 
-        Args:
-            claim_type: The type of the draw (3-Fold Repetition, 5-Fold Repetition,
-                                        50 Moves Rule, 75 Moves Rule).
-            players: The names of the players.
-        """
-        for index in range(self.claims_table_model.rowCount()):
-            try:
-                model_type = self.claims_table_model.item(index, 2).text()
-                model_players = self.claims_table_model.item(index, 4).text()
-            except AttributeError:
-                model_type = ""
-                model_players = ""
-
-            if model_type == claim_type.value and model_players == players:
-                self.remove_row_by_index(index)
-                self.reset_column_count()
-                break
-            elif (claim_type is ClaimType.FIVEFOLD and
-                  model_type == ClaimType.THREEFOLD.value and
-                  model_players == players):
-                self.remove_row_by_index(index)
-                self.reset_column_count()
-                break
-            elif (claim_type is ClaimType.SEVENTYFIVE_MOVES and
-                  model_type == ClaimType.FIFTY_MOVES.value and
-                  model_players == players):
-                self.remove_row_by_index(index)
-                self.reset_column_count()
-                break
-
-    def reset_column_count(self) -> None:
-        """ Re-index the numbers in the first column of Claims Table
-        (the "#" column) after the removal of rows (see remove_rows()).
-        """
-        row_count = self.claims_table_model.rowCount()
-        for index in range(row_count):
-            standard_item = QStandardItem(str(index + 1))
-            standard_item.setTextAlignment(Qt.AlignCenter)
-            self.claims_table_model.setItem(index, 0, standard_item)
+        self.notifier.post(entries)
 
     def clear_table(self):
         """ Clear all the elements off the Claims Table. """
-        for index in range(self.claims_table_model.rowCount()):
-            self.claims_table_model.removeRow(0)
+        self.claims_table_model.clear()
 
     def set_sources_status(self, status: Status, valid_sources: Optional[str] = None):
         """ Adds the sources in the statusBar.
@@ -325,6 +304,15 @@ class ChessClaimView(QMainWindow):
             self.download_image.clear()
             self.download_label.clear()
 
+    def set_download_traffic(self, received: int, saved: int) -> None:
+        """ Shows the downloaded bytes and the bytes saved by the conditional and partial
+        downloads as the ToolTip of the download status.
+        Args:
+            received: The number of bytes downloaded since the scan started.
+            saved: The number of bytes that did not have to be downloaded.
+        """
+        self.download_label.setToolTip(f"Downloaded: {received / 1024:.1f} KB\nSaved: {saved / 1024:.1f} KB")
+
     def set_scan_status(self, status: Status) -> None:
         """ Adds the scan status in the statusBar. """
         timestamp = str(datetime.now().strftime('%H:%M:%S'))
@@ -338,6 +326,16 @@ class ChessClaimView(QMainWindow):
             self.scan_label.clear()
             self.scan_image.clear()
 
+    def set_latency_status(self) -> None:
+        """ Shows the latency of the latest claim in the statusBar, and the breakdown per stage as its ToolTip. """
+        if not self.latency.latencies:
+            return
+        self.latency_label.setText(f"Latency: {self.latency.latencies[-1].total:.1f} s")
+        self.latency_label.setToolTip("\n".join(f"{stage}: {median:.2f} s (95%: {high:.2f} s)"
+                                                for stage, (median, high) in self.latency.breakdown().items()))
+        if self.latency_dialog.isVisible():
+            self.latency_dialog.update_gui()
+
     def change_scan_button_text(self, status: Status) -> None:
         """ Changes the text of the scanButton depending on the status of the application.
         Args:
@@ -392,7 +390,7 @@ class ChessClaimView(QMainWindow):
             event: The exit QEvent.
         """
         try:
-            if self.controller.scan_worker.isRunning():
+            if self.controller.scan_worker.is_alive():
                 exit_dialog = QMessageBox()
                 exit_dialog.setWindowTitle("Warning")
                 exit_dialog.setText("Scanning in Progress")
@@ -414,6 +412,41 @@ class ChessClaimView(QMainWindow):
         self.about_dialog.set_gui()
         self.about_dialog.show()
 
+    @staticmethod
+    def metrics_warning(port: int) -> None:
+        """ Displays a Warning Dialog, when the metrics cannot be served. """
+        warning_dialog = QMessageBox()
+        warning_dialog.setIcon(warning_dialog.Warning)
+        warning_dialog.setWindowTitle("Warning")
+        warning_dialog.setText("Metrics Endpoint Not Available")
+        warning_dialog.setInformativeText(f"The port {port} is already in use.")
+        warning_dialog.exec()
+
+    @staticmethod
+    def show_profiles(profiles: Profiles) -> None:
+        """ Displays the pstats files of the profiled scan.
+        Args:
+            profiles: The paths of the pstats files and the cycles that were not profiled.
+        """
+        profiles_dialog = QMessageBox()
+        profiles_dialog.setIcon(profiles_dialog.Information)
+        profiles_dialog.setWindowTitle("Profile Scan")
+        if profiles.paths:
+            profiles_dialog.setText("The profile of the scan was saved")
+            text = "\n".join(profiles.paths)
+        else:
+            profiles_dialog.setText("Nothing was profiled")
+            text = "Start a scan while Profile Scan is checked."
+        for name, count in profiles.skipped.items():
+            text += f"\n{count} {name} cycles were not profiled (another profiler was active)."
+        profiles_dialog.setInformativeText(text)
+        profiles_dialog.exec()
+
+    def load_latency_dialog(self):
+        """ Displays the Claim Latency Dialog. """
+        self.latency_dialog.update_gui()
+        self.latency_dialog.show()
+
 
 class ButtonBox(QWidget):
     """ Provides a Horizontal Box with two Buttons.
@@ -486,3 +519,58 @@ class AboutDialog(QDialog):
         layout.addWidget(copyright)
 
         self.setLayout(layout)
+
+
+class LatencyDialog(QDialog):
+    """ Shows the latency of the latest claims: a histogram of the time from the arrival of
+    the moves to the row in the claims table, and the time spent in every stage.
+    Attributes:
+        latency: The LatencyRecorder of the claims.
+        histogram: The labels of the buckets of the histogram.
+        breakdown: The labels of the stages.
+    """
+    BAR_WIDTH = 40
+    __slots__ = ["latency", "histogram", "breakdown"]
+
+    def __init__(self, latency: LatencyRecorder):
+        super().__init__()
+        self.latency = latency
+        self.setWindowTitle("Claim Latency")
+        self.setWindowFlags(self.windowFlags() ^ Qt.WindowContextHelpButtonHint)
+
+        self.histogram = QLabel()
+        self.histogram.setObjectName("histogram")
+        self.histogram.setStyleSheet("font-family: monospace")
+        self.breakdown = QGridLayout()
+
+        export_button = QPushButton("Export")
+        export_button.clicked.connect(self.on_export_clicked)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Time from the arrival of the moves to the row of the claim:"))
+        layout.addWidget(self.histogram)
+        layout.addLayout(self.breakdown)
+        layout.addWidget(export_button)
+        self.setLayout(layout)
+
+    def update_gui(self) -> None:
+        """ Shows the latency of the claims recorded so far. """
+        histogram = self.latency.histogram()
+        most = max(count for _, count in histogram) or 1
+        self.histogram.setText("\n".join(f"{label:>8} {'#' * round(count / most * self.BAR_WIDTH)} {count}"
+                                         for label, count in histogram))
+
+        while self.breakdown.count():
+            self.breakdown.takeAt(0).widget().deleteLater()
+        for column, title in enumerate(("Stage", "Median", "95%")):
+            self.breakdown.addWidget(QLabel(title), 0, column)
+        for row, (stage, (median, high)) in enumerate(self.latency.breakdown().items(), 1):
+            self.breakdown.addWidget(QLabel(stage), row, 0)
+            self.breakdown.addWidget(QLabel(f"{median:.2f} s"), row, 1)
+            self.breakdown.addWidget(QLabel(f"{high:.2f} s"), row, 2)
+
+    def on_export_clicked(self) -> None:
+        """ Exports the latency of every claim to a csv file chosen by the user. """
+        path, _ = QFileDialog.getSaveFileName(self, "Export Claim Latency", "latency.csv", "CSV (*.csv)")
+        if path:
+            self.latency.export(path)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from src.headless import main
+from src.helpers import ClaimType
+
+REPETITION = "1. Nf3 Nf6 2. Ng1 Ng8 3. Nf3 Nf6 4. Ng1 Ng8"
+
+
+def write_round(path, moves):
+    games = [f'[Event "Test"]\n[Round "1"]\n[Board "{board}"]\n[White "White {board}"]\n'
+             f'[Black "Black {board}"]\n[Result "*"]\n\n{moves} *\n' for board in range(1, 4)]
+    path.write_text("\n".join(games), encoding="utf-8")
+
+
+def read_claims(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def get_claim(claim):
+    """ Returns: The claim without the time it was written. """
+    return claim["type"], claim["board"], claim["players"], claim["move"]
+
+
+@pytest.fixture
+def run(tmp_path):
+    pgn = tmp_path / "round1.pgn"
+    output = tmp_path / "claims.jsonl"
+
+    def run_once(*args):
+        assert main([str(pgn), "--once", "--data-dir", str(tmp_path / "data"), "-o", str(output), *args]) == 0
+        return read_claims(output)
+
+    return pgn, run_once
+
+
+def test_restart_does_not_write_claims_again(run):
+    pgn, run_once = run
+    write_round(pgn, REPETITION)
+    claims = run_once()
+    assert len(claims) == 3
+
+    assert run_once() == claims
+
+
+def test_restart_writes_new_claims(run):
+    pgn, run_once = run
+    write_round(pgn, REPETITION)
+    claims = run_once()
+
+    # The games go on to a 5 Fold Repetition.
+    write_round(pgn, REPETITION + " 5. Nf3 Nf6 6. Ng1 Ng8 7. Nf3 Nf6 8. Ng1 Ng8")
+    new_claims = run_once()[len(claims):]
+    assert [claim["type"] for claim in new_claims].count(ClaimType.FIVEFOLD.value) == 3
+    assert not {get_claim(claim) for claim in claims} & {get_claim(claim) for claim in new_claims}
+
+
+def test_no_cache_writes_claims_again(run):
+    pgn, run_once = run
+    write_round(pgn, REPETITION)
+    claims = [get_claim(claim) for claim in run_once("--no-cache")]
+    assert [get_claim(claim) for claim in run_once("--no-cache")] == claims + claims
@@ -0,0 +1,23 @@
+from src.models import reader
+from src.models.reader import SourceReader
+
+GAME = '[Event "Test"]\n[White "{white}"]\n[Black "Black"]\n\n1. e4 *\n\n'
+
+
+def test_unreadable_source_is_read_on_the_next_pass(tmp_path, monkeypatch):
+    filepath = tmp_path / "round1.pgn"
+    filepath.write_text(GAME.format(white="A"), encoding="utf-8")
+    source_reader = SourceReader([str(filepath)])
+    assert len(list(source_reader.read_changed())) == 1
+
+    with open(filepath, "a", encoding="utf-8") as pgn:
+        pgn.write(GAME.format(white="B"))
+
+    def locked(*args, **kwargs):
+        raise PermissionError("The process cannot access the file because it is being used by another process")
+
+    monkeypatch.setattr(reader, "open", locked, raising=False)
+    assert list(source_reader.read_changed()) == []
+
+    monkeypatch.undo()
+    assert any(b'[White "B"]' in raw_game for _, raw_game in source_reader.read_changed())
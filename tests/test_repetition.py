@@ -0,0 +1,117 @@
+import random
+
+from chess import Board
+
+from src.models.claims import GameCursor
+
+SHUFFLE = "Nf3 Nf6 Ng1 Ng8"
+
+
+def get_moves(board, sans):
+    board = board.copy()
+    moves = []
+    for san in sans.split():
+        moves.append(board.push_san(san))
+    return moves
+
+
+def get_random_moves(board, rng, plies=200):
+    """ Returns: The moves of a random game, mostly reversible moves so that the positions repeat. """
+    board = board.copy()
+    moves = []
+    while len(moves) < plies and not board.is_game_over():
+        legal_moves = list(board.legal_moves)
+        reversible = [move for move in legal_moves if not board.is_irreversible(move)]
+        moves.append(rng.choice(reversible if reversible and rng.random() < 0.9 else legal_moves))
+        board.push(moves[-1])
+    return moves
+
+
+def check_counts(board, moves):
+    """ Asserts that the cursor counts every position the way Board.is_repetition does.
+    Returns: The number of occurrences of every position after the moves.
+    """
+    cursor = GameCursor(board.copy())
+    counts = []
+    for move in moves:
+        repetitions = cursor.push(move)
+        board.push(move)
+        assert board.is_repetition(repetitions)
+        assert not board.is_repetition(repetitions + 1)
+        counts.append(repetitions)
+    return counts
+
+
+def test_knight_shuffle():
+    board = Board()
+    counts = check_counts(board, get_moves(board, " ".join([SHUFFLE] * 4)))
+    assert counts[3::4] == [2, 3, 4, 5]
+
+
+def test_pseudo_legal_en_passant_square():
+    # After e4 the pawn on d4 could capture en passant, but it is pinned to its king by the rook.
+    board = Board("6n1/8/8/8/k2p3R/8/4P3/4K1N1 w - - 0 1")
+    counts = check_counts(board, get_moves(board, "e4 Nf6 Nf3 Ng8 Ng1 Nf6 Nf3 Ng8 Ng1"))
+    assert counts[-1] == 3
+
+
+def test_legal_en_passant_square():
+    # After e4 the pawn on d4 can capture en passant, so the position differs from the later ones.
+    board = Board("6n1/8/8/8/3p4/8/4P3/k3K1N1 w - - 0 1")
+    counts = check_counts(board, get_moves(board, "e4 Nf6 Nf3 Ng8 Ng1 Nf6 Nf3 Ng8 Ng1"))
+    assert counts[-1] == 2
+
+
+def test_castling_rights_lost_by_a_captured_rook():
+    # The rook of h1 is captured, so White loses the kingside castling without a king or rook move.
+    board = Board("r3k2r/8/8/8/8/6n1/8/R3K2R b KQkq - 0 1")
+    moves = get_moves(board, "Nxh1 Rb1 Ng3 Ra1 Nh1 Rb1 Ng3 Ra1 Nh1 Rb1 Ng3 Ra1 Nh1")
+    counts = check_counts(board, moves)
+    assert not board.has_kingside_castling_rights(True)
+    assert counts[-1] == 3
+
+
+def test_castling_rights_lost_by_a_rook_move():
+    board = Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    counts = check_counts(board, get_moves(board, "Rh2 Rh7 Rh1 Rh8 Rh2 Rh7 Rh1 Rh8 Rh2 Rh7 Rh1 Rh8"))
+    # The positions with the rooks back on h1 and h8 have no castling rights on their side.
+    assert counts[-1] == 3
+
+
+def test_chess960_starts():
+    rng = random.Random(960)
+    for scharnagl in (0, 191, 518, 959):
+        board = Board.from_chess960_pos(scharnagl)
+        check_counts(board, get_random_moves(board, rng))
+
+
+def test_chess960_castling():
+    # The king and the rook of the castling start next to each other.
+    board = Board("nrk1bbqr/pppppppp/8/8/8/8/PPPPPPPP/NRKNBBQR w HBhb - 0 1", chess960=True)
+    moves = get_moves(board, "Ne3 Nb6 O-O-O O-O-O Kb1 Kb8 Kc1 Kc8 Kb1 Kb8 Kc1 Kc8 Kb1 Kb8")
+    counts = check_counts(board, moves)
+    assert counts[-1] == 3
+
+
+def test_random_games():
+    rng = random.Random(0)
+    for _ in range(20):
+        board = Board()
+        check_counts(board, get_random_moves(board, rng))
+
+
+def test_irreversible_move_resets_the_table():
+    board = Board()
+    cursor = GameCursor(board.copy())
+    for move in get_moves(board, SHUFFLE + " " + SHUFFLE):
+        cursor.push(move)
+    assert len(cursor.positions) == 4
+
+    for move, size in zip(get_moves(cursor.board, "e4 e5 Nf3"), (1, 1, 2)):
+        cursor.push(move)
+        assert len(cursor.positions) == size
+
+    # The start position occurred 3 times, but no position before e4 can occur again.
+    moves = get_moves(board, SHUFFLE + " " + SHUFFLE + " e4 Nf6 Nf3 Ng8 Ng1 Nf6 Nf3 Ng8 Ng1")
+    counts = check_counts(board, moves)
+    assert counts[-1] == 3
@@ -0,0 +1,31 @@
+import pytest
+
+from src.models.watcher import FileWatcher
+
+pytest.importorskip("watchdog")
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    filepath = tmp_path / "games.pgn"
+    filepath.write_bytes(b'[Event "Test"]\n\n1. e4 *\n')
+    watcher = FileWatcher([str(filepath)])
+    watcher.start()
+    # The events of the creation of the file may still be delivered after the start.
+    watcher.wait(0.5)
+    yield watcher, filepath
+    watcher.stop()
+
+
+def test_read_does_not_wake(watcher):
+    watcher, filepath = watcher
+    with open(filepath, "rb") as pgn:
+        pgn.read()
+    assert not watcher.wait(1)
+
+
+def test_write_wakes(watcher):
+    watcher, filepath = watcher
+    with open(filepath, "ab") as pgn:
+        pgn.write(b'\n[Event "Test"]\n\n1. d4 *\n')
+    assert watcher.wait(2)